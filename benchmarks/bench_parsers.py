@@ -0,0 +1,284 @@
+"""
+Замеры горячих участков разбора на синтетических данных, похожих на Data/raw_response.txt и страницы olimp.com:
+OlimpBet._get_games, OlimpBet._extract_coeffs, OlimpCom._get_games, OlimpCom._extract_coeffs / extract_coeffs_lxml
+(все исходы страницы матча, как в работе), сопоставление игр в get_same_games и сравнение
+в show_same_games_with_coeffs, для 10/100/1000/10000 событий.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_parsers                  # замер и сравнение с сохраненной базой
+    python -m benchmarks.bench_parsers --save-baseline  # замер и сохранение новой базы
+    python -m benchmarks.bench_parsers --sizes 10 100   # только заданные размеры
+
+Если время какого-либо замера хуже базы больше чем на --tolerance, выводится REGRESSION и код возврата 1.
+База (baseline.json) - замеры конкретной машины: на другой машине, а также после изменения замеряемого кода
+ее нужно сначала пересохранить (--save-baseline) на коде до изменения, иначе сравнение ничего не значит.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from olimp_compare import show_same_games_with_coeffs
+from src.matching import GameMatcher, get_same_games
+from src.olimp_bet import OlimpBet
+from src.olimp_com import OlimpCom
+from src.parsers import extract_coeffs_lxml
+from src.records import Game
+
+BASELINE_FILE = Path(__file__).resolve().parent / 'baseline.json'
+SIZES = (10, 100, 1000, 10000)
+EVENTS_PER_COMPETITION = 10
+COEFF_NAME_BET = 'Исход матча (основное время)'
+COEFF_NAME_COM = 'П1'
+
+
+def make_outcomes(event_id: int) -> list[dict]:
+    rnd = random.Random(event_id)
+    outcomes = []
+    for position, short_name in enumerate(("П1", "Х", "П2", "1Х", "12", "Х2"), start=1):
+        outcomes.append({
+            "id": f"-{event_id}{position}",
+            "tableType": "RESULT",
+            "groupName": COEFF_NAME_BET,
+            "groupPosition": 1,
+            "probability": f"{rnd.uniform(1.05, 9):.2f}",
+            "param": "-9999.00",
+            "shortName": short_name,
+            "groupId": "OLIMP_LIVE_GROUP_177_0",
+            "categories": ["RESULT"],
+            "positionInGroup": position,
+            "marketId": 1,
+        })
+    for param in ("1.50", "2.50", "3.50"):
+        for short_name in ("ТотБ", "ТотМ"):
+            outcomes.append({
+                "id": f"-{event_id}{short_name}{param}",
+                "tableType": "TOTAL",
+                "groupName": "Доп. Тотал",
+                "groupPosition": 3,
+                "probability": f"{rnd.uniform(1.2, 3.5):.2f}",
+                "param": param,
+                "shortName": short_name,
+                "groupId": "OLIMP_LIVE_GROUP_178_0",
+                "categories": ["TOTAL"],
+                "positionInGroup": 1,
+                "marketId": 3,
+            })
+    return outcomes
+
+
+def event_name(event_id: int) -> str:
+    return f'Команда {event_id} - Соперник {event_id}'
+
+
+def make_olimpbet_feed(size: int) -> str:
+    """
+    Ответ olimp.bet в формате Data/raw_response.txt: футбол с size событиями и блок хоккея, который отбрасывается.
+    """
+    operations = []
+    for sport_id, sport_name, events_count in (("1", "Футбол", size), ("2", "Хоккей", max(1, size // 10))):
+        competitions = []
+        for start in range(0, events_count, EVENTS_PER_COMPETITION):
+            competition_id = f'{sport_id}{start}'
+            events = []
+            for event_id in range(start, min(start + EVENTS_PER_COMPETITION, events_count)):
+                events.append({
+                    "id": f'{sport_id}{event_id:08d}',
+                    "sportId": sport_id,
+                    "sportName": sport_name,
+                    "competitionId": competition_id,
+                    "competitionName": f'Лига {competition_id}',
+                    "startDateTime": 1711206000 + event_id,
+                    "names": {"0": event_name(event_id), "2": f'Team {event_id} - Rival {event_id}'},
+                    "name": event_name(event_id),
+                    "comment": "",
+                    "score": "0:0",
+                    "state": "OPEN",
+                    "outcomes": make_outcomes(event_id),
+                })
+            competitions.append({
+                "id": competition_id,
+                "competition": {"id": competition_id, "sportName": sport_name, "name": f'Лига {competition_id}'},
+                "events": events,
+            })
+        operations.append({
+            "operationId": "LIVE_SPORTS_WITH_COMPETITIONS_WITH_EVENTS_FIND_BY_SPORT_ID",
+            "id": sport_id,
+            "version": 1,
+            "payload": {
+                "id": sport_id,
+                "sport": {"id": sport_id, "name": sport_name, "eventCount": events_count},
+                "competitionsWithEvents": competitions,
+            },
+        })
+    return json.dumps(operations, ensure_ascii=False, indent=4)
+
+
+def make_olimpcom_list(size: int) -> str:
+    rows = []
+    for event_id in range(size):
+        rows.append(f'<tr data-sport="1"><td class="time">45\'</td><td><input type="checkbox"></td>'
+                    f'<td><a href="index.php?page=line&amp;action=2&amp;live[]={event_id}" '
+                    f'id="match_live_name_{event_id}">{event_name(event_id)}</a></td></tr>')
+    return f'<html><head><meta charset="utf-8"></head><body><table>{"".join(rows)}</table></body></html>'
+
+
+def make_olimpcom_match(event_id: int) -> str:
+    spans = []
+    for outcome in make_outcomes(event_id):
+        name = outcome.get("shortName")
+        if outcome.get("param") != "-9999.00":
+            name = f'{name}({float(outcome.get("param")):g})'
+        spans.append(f'<nobr><span class="googleStatIssueName">{name}</span> - '
+                     f'<span class="bet_sel" data-v1="{outcome.get("probability")}">{outcome.get("probability")}</span>'
+                     f'</nobr>')
+    return f'<html><body><div class="koeff">{"".join(spans)}</div></body></html>'
+
+
+def olimpcom_name(event_id: int) -> str:
+    """
+    Название того же матча на olimp.com: часть названий совпадает после нормализации (тире вместо дефиса),
+    часть - только по похожести (дополнение к названию команды), как на настоящих сайтах.
+    """
+    if event_id % 3 == 1:
+        return f'Команда {event_id} – Соперник {event_id}'
+    if event_id % 3 == 2:
+        return f'Команда {event_id} ФК - Соперник {event_id}'
+    return event_name(event_id)
+
+
+def make_games(size: int, olimp_bet: OlimpBet) -> tuple[dict, dict]:
+    """
+    Игры olimp.bet с коэффициентами и те же игры olimp.com под своими названиями, с немного другими коэффициентами.
+    """
+    games_bet = olimp_bet._get_games(make_olimpbet_feed(size))
+    games_bet = asyncio.run(olimp_bet._get_all_coefficients(games_bet, COEFF_NAME_BET))
+    games_com = dict()
+    for event_id, game in enumerate(games_bet.values()):
+        rnd = random.Random(-event_id)
+        name = olimpcom_name(event_id)
+        games_com[name] = Game(
+            comp_name=name,
+            comp_id=str(event_id),
+            sport="Футбол",
+            site="olimp.com",
+            coeffs={outcome: round(coeff * rnd.uniform(0.95, 1.05), 2) for outcome, coeff in game.coeffs.items()},
+        )
+    return games_bet, games_com
+
+
+def measure(func, calls: int, min_time: float = 0.2) -> dict:
+    """
+    :param func: замеряемая функция без аргументов
+    :param calls: сколько событий обрабатывает один вызов (для расчета пропускной способности)
+    """
+    func()
+    repeat, elapsed = 0, 0.0
+    start_time = time.perf_counter()
+    while elapsed < min_time or repeat < 3:
+        func()
+        repeat += 1
+        elapsed = time.perf_counter() - start_time
+    latency = elapsed / repeat
+
+    # выделение памяти за вызов - отдельным запуском, tracemalloc сильно замедляет работу
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "latency_ms": round(latency * 1000, 3),
+        "events_per_sec": round(calls / latency, 1),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def get_benchmarks(size: int) -> dict:
+    olimp_bet = OlimpBet(url='', user_agent='', timeout=30, xguid_olimpbet='', user_ukey='',
+                         sport_list=['Футбол'], coeff_name=COEFF_NAME_BET)
+    olimp_bet_stream = OlimpBet(url='', user_agent='', timeout=30, xguid_olimpbet='', user_ukey='',
+                                sport_list=['Футбол'], coeff_name=COEFF_NAME_BET, json_engine='stream')
+    olimp_com = OlimpCom(url='https://olimp.com/betting', user_agent='', timeout=30,
+                         sport_list=['Футбол'], coeff_name=COEFF_NAME_COM)
+    olimp_com_lxml = OlimpCom(url='https://olimp.com/betting', user_agent='', timeout=30,
+                              sport_list=['Футбол'], coeff_name=COEFF_NAME_COM, parser_engine='lxml')
+
+    feed = make_olimpbet_feed(size)
+    feed_bytes = feed.encode('utf-8')
+    games_bet = olimp_bet._get_games(feed)
+    games_bet_list = list(games_bet.values())
+    list_page = make_olimpcom_list(size)
+    match_pages = [make_olimpcom_match(event_id) for event_id in range(size)]
+    games_bet_coeffs, games_com = make_games(size, olimp_bet)
+    same_games = get_same_games([games_bet_coeffs, games_com])
+
+    return {
+        "OlimpBet._get_games[json]": lambda: olimp_bet._get_games(feed),
+        "OlimpBet._get_games[stream]": lambda: olimp_bet_stream._get_games(feed_bytes),
+        "OlimpBet._extract_coeffs": lambda: [OlimpBet._extract_coeffs(game) for game in games_bet_list],
+        "OlimpCom._get_games[bs4]": lambda: olimp_com._get_games(list_page),
+        "OlimpCom._get_games[lxml]": lambda: olimp_com_lxml._get_games(list_page),
+        "OlimpCom._extract_coeffs[bs4]": lambda: [OlimpCom._extract_coeffs(page) for page in match_pages],
+        "OlimpCom._extract_coeffs[lxml]": lambda: [extract_coeffs_lxml(page) for page in match_pages],
+        # новый GameMatcher на каждый вызов: без кэша пар, все игры сопоставляются по названиям
+        "get_same_games": lambda: get_same_games([games_bet_coeffs, games_com], GameMatcher()),
+        "show_same_games_with_coeffs": lambda: show_same_games_with_coeffs(same_games, sign_list=['>', '<', '=']),
+    }
+
+
+def run(sizes: list[int]) -> dict:
+    results = dict()
+    for size in sizes:
+        for name, func in get_benchmarks(size).items():
+            result = measure(func, calls=size)
+            results.setdefault(name, dict())[str(size)] = result
+            print(f'{name:<32} {size:>6}: {result.get("latency_ms"):>10} мс/вызов, '
+                  f'{result.get("events_per_sec"):>12} событий/сек, пик памяти {result.get("peak_kb"):>9} КБ')
+    return results
+
+
+def compare_with_baseline(results: dict, tolerance: float) -> bool:
+    if not BASELINE_FILE.exists():
+        print(f'Нет сохраненной базы {BASELINE_FILE}, сравнение пропущено (--save-baseline для сохранения)')
+        return True
+    baseline = json.loads(BASELINE_FILE.read_text(encoding='utf-8'))
+    is_ok = True
+    for name, sizes in results.items():
+        for size, result in sizes.items():
+            base = baseline.get(name, {}).get(size)
+            if not base:
+                continue
+            ratio = result.get("latency_ms") / base.get("latency_ms")
+            if ratio > 1 + tolerance:
+                is_ok = False
+                print(f'REGRESSION {name} [{size}]: {base.get("latency_ms")} -> {result.get("latency_ms")} мс '
+                      f'(+{round((ratio - 1) * 100, 1)}%)')
+    if is_ok:
+        print(f'Регрессий относительно базы нет (допуск {round(tolerance * 100)}%)')
+    return is_ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры разбора ответов olimp.bet и olimp.com')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='допустимое ухудшение времени, доля')
+    args = parser.parse_args()
+
+    # в замерах вывод результатов сравнения не нужен
+    logging.disable(logging.CRITICAL)
+    results = run(args.sizes)
+    if args.save_baseline:
+        BASELINE_FILE.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f'База сохранена: {BASELINE_FILE}')
+        return 0
+    return 0 if compare_with_baseline(results, args.tolerance) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,97 +1,375 @@
 import asyncio
-import distutils
+import contextlib
 import logging.handlers
+import signal
 import sys
 import time
+from concurrent.futures import Executor, ProcessPoolExecutor
 from configparser import ConfigParser
+from functools import partial
 
-from playwright.async_api import async_playwright
-
+from src.browser import BrowserSession
+from src.daemon import CompareDaemon
+from src.diff import DiffEngine, sign
+from src.http_client import HttpClient
+from src.jobs import Job, JobOutput
 from src.logger import set_logger
+from src.matching import GameMatcher, get_same_games
+from src.metrics import METRICS
 from src.olimp_bet import OlimpBet
 from src.olimp_com import OlimpCom
+from src.output import SINKS, Output, log_record, make_output
+from src.pair_cache import PairCache
+from src.proxy_pool import ProxyPool
+from src.records import Game
+from src.replay import Recorder, ReplayServer, benchmark_report
+from src.resilience import ResiliencePolicy
+from src.scheduler import RequestScheduler
 from src.states import OlimpCodes
+from src.sports import DATA_SPORT, DEFAULT_MARKET
+from src.storage import SnapshotStore
 
+SIGN_CODES = {'>': 1.0, '<': -1.0, '=': 0.0}
+SIGN_BY_CODE = {code: sign for sign, code in SIGN_CODES.items()}
+# игры, страницы которых получены, сравниваются пачками: не больше COMPARE_BATCH_SIZE игр
+# и не позже чем через COMPARE_BATCH_DELAY сек после получения первой игры пачки
+COMPARE_BATCH_SIZE = 100
+COMPARE_BATCH_DELAY = 0.1
 
-def show_only_same_games(olimps: list):
-    olimp_bet, olimp_com = olimps
-    if len(olimp_bet) > len(olimp_com):
-        main_olimp = olimp_bet
-        compare_olimp = olimp_com
-    else:
-        main_olimp = olimp_com
-        compare_olimp = olimp_bet
-    same_list = []
-    for name, game in main_olimp.items():
-        game_compare = compare_olimp.get(name)
-        if game_compare:
-            comp_id = game.get("comp_id")
-            site = game.get("site")
-            comp_id_compare = game_compare.get("comp_id")
-            site_compare = game_compare.get("site")
-            same_list.append(f"{site} [{comp_id} {name}] - {site_compare} [{comp_id_compare} {name}]")
-
-    if not same_list:
-        logging.info('Не найдены совпадающие игры!')
-    else:
 
-        same_message = "\n".join(same_list)
-        logging.info(f'Совпадающие игры:\n{same_message}\n\nКоличество совпадений =  {len(same_list)}')
+def _pair_record(record_type: str, name: str, game: Game, game_compare: Game) -> dict:
+    """
+    Запись о совпадении для вывода (src.output): игры обоих сайтов и уверенность сопоставления.
+    """
+    return {
+        "type": record_type,
+        "ts": time.time(),
+        "game": name,
+        "site": game.site,
+        "comp_id": game.comp_id,
+        "comp_name": game.comp_name or name,
+        "site_compare": game_compare.site,
+        "comp_id_compare": game_compare.comp_id,
+        "comp_name_compare": game_compare.comp_name or name,
+        "confidence": game.match_confidence,
+    }
+
+
+def show_only_same_games(olimps: list, matcher: GameMatcher | None = None, output: Output | None = None):
+    """
+    :param output: очередь вывода записей, если не задана - записи сразу выводятся в лог
+    """
+    _show_pairs(get_same_games(olimps, matcher), output)
+
+
+def _show_pairs(same_games: list[dict, dict], output: Output | JobOutput | None = None):
+    same_bet, same_com = same_games
+    emit = output.emit if output is not None else log_record
+    for name, game in same_com.items():
+        emit(_pair_record('pair', name, game, same_bet.get(name)))
+    emit({"type": "summary", "kind": "pairs", "ts": time.time(), "count": len(same_com)})
+
+
+def show_jobs(olimps: list[dict, dict],
+              jobs: list[Job],
+              get_coeffs: bool,
+              matcher: GameMatcher | None = None,
+              output: Output | None = None,
+              engines: dict[str, DiffEngine] | None = None):
+    """
+    Вывод сравнения по всем заданиям для одних и тех же данных: совпадения ищутся один раз,
+    каждое задание выбирает из них свои виды спорта и исходы.
+    :param olimps: с коэффициентами - совпадающие игры под одним ключом (результат get_same_games),
+        без коэффициентов - списки игр сайтов
+    :param engines: название задания -> DiffEngine для вывода только изменений (None - вывод всех совпадений)
+    """
+    same_games = olimps if get_coeffs else get_same_games(olimps, matcher)
+    for job in jobs:
+        job_output = JobOutput(output, job.name)
+        job_games = job.apply(*same_games)
+        if not get_coeffs:
+            _show_pairs(job_games, job_output)
+        elif engines is not None:
+            show_changes_with_coeffs(job_games, engines[job.name], job.sign_list, job_output)
+        else:
+            show_same_games_with_coeffs(job_games, job.sign_list, job_output)
 
 
-def show_same_games_with_coeffs(olimps: list[dict, dict], sign_list: list):
+def show_same_games_with_coeffs(olimps: list[dict, dict],
+                                sign_list: list,
+                                output: Output | JobOutput | None = None,
+                                summary: bool = True) -> tuple[int, int]:
     """
-    Вывод информации о найденных совпадениях.
-    :param olimps: список полученных игр для заданных сайтов
+    Вывод информации о найденных совпадениях: по каждому исходу, который есть на olimp.com и на olimp.bet,
+    и маржа/вилка по наборам исходов. Расчеты ведутся сразу по всем играм (src.markets).
+    Каждое совпадение выводится отдельной записью сразу после расчета.
+    :param olimps: список полученных игр для заданных сайтов (результат get_same_games, совпадающие игры под одним ключом)
     :param sign_list: список допустимых к выводу знаков (если НЕ указано "=", то такие совпадения пропустит)
+    :param output: очередь вывода записей, если не задана - записи сразу выводятся в лог
+    :param summary: вывести итог (количество совпадений и вилок)
+    :return: количество выведенных совпадений и совпадений с вилкой
     """
+    # numpy и таблицы рынков загружаются только для сравнения коэффициентов (GET_COEFFS)
+    import numpy as np
+
+    from src.markets import MarketTable
+
     olimp_bet, olimp_com = olimps
+    emit = output.emit if output is not None else log_record
+    table = MarketTable.from_games(olimp_com, olimp_bet)
+    result = table.compare()
+    signs = result.get("signs")
+    allowed = np.isin(signs, [SIGN_CODES[sign] for sign in sign_list if sign in SIGN_CODES])
+    books = result.get("books")
 
-    # не всегда количество игр одинаковое и проверка по большему идет
-    if len(olimp_bet) > len(olimp_com):
-        main_olimp = olimp_bet
-        compare_olimp = olimp_com
-    else:
-        main_olimp = olimp_com
-        compare_olimp = olimp_bet
-    same_list = []
-    for name, game in main_olimp.items():
-        game_compare = compare_olimp.get(name)
-        if game_compare:
-            comp_id = game.get("comp_id")
-            site = game.get("site")
-            comp_id_compare = game_compare.get("comp_id")
-            site_compare = game_compare.get("site")
-
-            short_name = game.get("short_name") or game_compare.get("short_name")
-
-            coeff = game.get("coeff")
-            coeff_compare = game_compare.get("coeff")
-            if not all([coeff, coeff_compare]):
-                continue
-            if coeff > coeff_compare:
-                sign = '>'
-            elif coeff < coeff_compare:
-                sign = '<'
-            else:
-                sign = '='
-
-            if sign not in sign_list:
+    count = 0
+    arbitrage_count = 0
+    for row, name in enumerate(table.keys):
+        columns = np.flatnonzero(allowed[row])
+        if not len(columns):
+            continue
+        record = _pair_record('coeffs', name, olimp_com[name], olimp_bet[name])
+        record["outcomes"] = [{"outcome": table.outcomes[column],
+                               "coeff": float(table.coeffs[row, column]),
+                               "sign": SIGN_BY_CODE[signs[row, column]],
+                               "coeff_compare": float(table.coeffs_compare[row, column])} for column in columns]
+        record["books"] = []
+        for book_name, book in books.items():
+            arbitrage = book.get("arbitrage")[row]
+            # не все исходы набора есть на обоих сайтах - маржа и вилка по набору не считаются
+            if np.isnan(arbitrage):
                 continue
+            record["books"].append({"book": book_name,
+                                    "margin": round(float(book.get("margin")[row]), 2),
+                                    "margin_compare": round(float(book.get("margin_compare")[row]), 2),
+                                    "arbitrage": round(float(arbitrage), 2)})
+        record["is_arbitrage"] = any(book.get("arbitrage") > 0 for book in record["books"])
+        emit(record)
+        count += 1
+        arbitrage_count += record["is_arbitrage"]
 
-            same_msg = f"{site} [{comp_id} {name}] - {site_compare} [{comp_id_compare} {name}]"
-            same_coeff = f"{short_name} - {site} {coeff} {sign} {coeff_compare} {site_compare}"
-            same_list.append(f'{same_msg} ---> {same_coeff}')
+    if summary:
+        emit(_coeffs_summary(count, arbitrage_count, sign_list))
+    return count, arbitrage_count
 
-    if not same_list:
-        logging.info('Не найдены совпадающие игры с заданным знаком!')
-    else:
 
-        same_msg = "\n".join(same_list)
-        signs_msg = " ".join(sign_list)
-        logging.info(
-            f'Совпадающие игры для набора знаков "{signs_msg}":\n{same_msg}\n\n'
-            f'Количество совпадений =  {len(same_list)}')
+class CoeffsBatch:
+    """
+    Сравнение коэффициентов по мере получения страниц olimp.com: игры копятся и сравниваются пачкой
+    (одна таблица src.markets на пачку в каждом задании), поэтому вывод не ждет все страницы,
+    а маржа и вилки по-прежнему считаются сразу для многих игр.
+    """
+
+    def __init__(self,
+                 games_compare: dict,
+                 jobs: list[Job],
+                 output: Output | None = None,
+                 max_size: int = COMPARE_BATCH_SIZE,
+                 delay: float = COMPARE_BATCH_DELAY):
+        """
+        :param games_compare: игры olimp.bet с коэффициентами под ключами совпадающих игр
+        """
+        self.games_compare = games_compare
+        self.jobs = jobs
+        self.outputs = {job.name: JobOutput(output, job.name) for job in jobs}
+        self.max_size = max_size
+        self.delay = delay
+        # название задания -> количество выведенных совпадений и совпадений с вилкой
+        self.counts = {job.name: [0, 0] for job in jobs}
+        self._pending = dict()
+        self._timer: asyncio.TimerHandle | None = None
+
+    def add(self, name: str, game: Game):
+        """
+        Игра olimp.com с коэффициентами (вызывается из get_coefficients по мере разбора страниц).
+        """
+        self._pending[name] = game
+        if len(self._pending) >= self.max_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.delay, self.flush)
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        games, self._pending = self._pending, dict()
+        games_compare = {name: self.games_compare[name] for name in games}
+        with METRICS.timer("olimp_compare_seconds"):
+            # страница матча получена один раз, игра сравнивается во всех заданиях с ее видом спорта
+            for job in self.jobs:
+                job_games = job.apply(games_compare, games)
+                if not job_games[0]:
+                    continue
+                count, arbitrage_count = show_same_games_with_coeffs(job_games, job.sign_list,
+                                                                     self.outputs[job.name], summary=False)
+                self.counts[job.name][0] += count
+                self.counts[job.name][1] += arbitrage_count
+
+    def summary(self):
+        for job in self.jobs:
+            self.outputs[job.name].emit(_coeffs_summary(*self.counts[job.name], job.sign_list))
+
+
+def _coeffs_summary(count: int, arbitrage_count: int, sign_list: list) -> dict:
+    return {"type": "summary", "kind": "coeffs", "ts": time.time(), "count": count, "arbitrage": arbitrage_count,
+            "signs": sign_list}
+
+
+def show_changes_with_coeffs(olimps: list[dict, dict],
+                             engine: DiffEngine,
+                             sign_list: list,
+                             output: Output | JobOutput | None = None):
+    """
+    Вывод только изменений с прошлого вызова: новые и пропавшие совпадения, изменившиеся коэффициенты
+    и смена знака сравнения. Для новых совпадений выводятся исходы с допустимыми знаками.
+    :param engine: хранит состояние прошлого вызова, один экземпляр на весь постоянный режим
+    :param sign_list: список допустимых к выводу знаков для новых совпадений
+    :param output: очередь вывода записей, если не задана - записи сразу выводятся в лог
+    """
+    olimp_bet, olimp_com = olimps
+    emit = output.emit if output is not None else log_record
+    delta = engine.update(olimp_com, olimp_bet)
+
+    for name in delta.added:
+        game, game_compare = olimp_com[name], olimp_bet[name]
+        coeffs, coeffs_compare = game.coeffs or {}, game_compare.coeffs or {}
+        record = _pair_record('added', name, game, game_compare)
+        record["outcomes"] = []
+        for outcome in sorted(coeffs.keys() & coeffs_compare.keys()):
+            coeff_sign = sign(coeffs[outcome], coeffs_compare[outcome])
+            if coeff_sign in sign_list:
+                record["outcomes"].append({"outcome": outcome, "coeff": coeffs[outcome], "sign": coeff_sign,
+                                           "coeff_compare": coeffs_compare[outcome]})
+        emit(record)
+    for name, changes in delta.changed.items():
+        record = _pair_record('changed', name, olimp_com[name], olimp_bet[name])
+        record["outcomes"] = [{"outcome": change.outcome,
+                               "coeff_old": change.coeff_old,
+                               "coeff": change.coeff,
+                               "coeff_compare_old": change.coeff_compare_old,
+                               "coeff_compare": change.coeff_compare,
+                               "sign_old": change.sign_old,
+                               "sign": change.sign,
+                               "is_sign_flip": change.is_sign_flip} for change in changes]
+        emit(record)
+    for name in delta.removed:
+        emit({"type": "removed", "ts": time.time(), "game": name})
+
+    emit({"type": "summary", "kind": "changes", "ts": time.time(),
+          "count": len(delta.added) + len(delta.removed) + len(delta.changed),
+          "added": len(delta.added), "removed": len(delta.removed), "changed": len(delta.changed),
+          "sign_flips": delta.sign_flips, "unchanged": delta.unchanged, "unknown": delta.unknown})
+
+
+def _read_int(config: ConfigParser, key: str, default: int) -> int:
+    """
+    Необязательный целочисленный параметр из раздела [Settings]. Если не задан или задан с ошибкой - default.
+    """
+    try:
+        return int(config['Settings'][key])
+    except KeyError:
+        return default
+    except ValueError:
+        logging.error(f'Неверное значение {key} в config.ini, используется {default}')
+        return default
+
+
+def _read_float(config: ConfigParser, key: str, default: float) -> float:
+    try:
+        return float(config['Settings'][key])
+    except KeyError:
+        return default
+    except ValueError:
+        logging.error(f'Неверное значение {key} в config.ini, используется {default}')
+        return default
+
+
+def _strtobool(value: str) -> bool:
+    """
+    Замена distutils.util.strtobool (модуля distutils нет начиная с Python 3.12).
+    """
+    value = value.strip().lower()
+    if value in ('y', 'yes', 't', 'true', 'on', '1'):
+        return True
+    if value in ('n', 'no', 'f', 'false', 'off', '0'):
+        return False
+    raise ValueError(f'неверное логическое значение {value!r}')
+
+
+def _read_bool(config: ConfigParser, key: str, default: bool) -> bool:
+    try:
+        return _strtobool(config['Settings'][key])
+    except KeyError:
+        return default
+    except ValueError:
+        logging.error(f'Неверное значение {key} в config.ini, используется {default}')
+        return default
+
+
+def _parse_sport_list(value: str, key: str) -> list[str]:
+    """
+    Виды спорта через запятую, неизвестные пропускаются.
+    """
+    sport_list = [sport.strip() for sport in value.split(',') if sport.strip()]
+    for sport in sport_list:
+        if sport not in DATA_SPORT:
+            logging.error(f'Неизвестный вид спорта "{sport}" в {key}, известные: {", ".join(DATA_SPORT)}')
+    return [sport for sport in sport_list if sport in DATA_SPORT]
+
+
+def _parse_market(value: str | None, key: str) -> tuple[str, str | None] | None:
+    """
+    Рынок "<группа исходов olimp.bet>" или "<группа исходов olimp.bet> | <исход>" - (группа, исход или None).
+    None - рынок не задан или задан с ошибкой.
+    :param key: ключ в config.ini для сообщения об ошибке (ключи ConfigParser не зависят от регистра:
+        MARKET_Хоккей и market_хоккей - один ключ)
+    """
+    if value is None:
+        return None
+    group_name, _, short_name = value.partition('|')
+    if not group_name.strip():
+        logging.error(f'{key} задан с ошибкой, нужно "<группа olimp.bet>" или "<группа olimp.bet> | <исход>"')
+        return None
+    return group_name.strip(), short_name.strip() or None
+
+
+def _read_jobs(config: ConfigParser, sport_list: list[str]) -> list[Job]:
+    """
+    Задания из разделов [Job:<название>]:
+    - SPORT_LIST: виды спорта задания (по умолчанию - SPORT_LIST из [Settings])
+    - SIGNS: допустимые к выводу знаки через запятую (по умолчанию > и <)
+    - MARKET, MARKET_<вид спорта>: "<группа исходов olimp.bet>" или "<группа исходов olimp.bet> | <исход>" -
+      сравниваются только исходы этого рынка (по умолчанию - все исходы)
+    """
+    jobs = []
+    for section in config.sections():
+        if not section.startswith('Job:'):
+            continue
+        name = section.removeprefix('Job:').strip() or section
+        job_config = config[section]
+        job_sport_list = _parse_sport_list(job_config['SPORT_LIST'], f'[{section}] SPORT_LIST') \
+            if 'SPORT_LIST' in job_config else sport_list
+        if not job_sport_list:
+            logging.error(f'В задании "{name}" нет известных видов спорта, задание пропущено')
+            continue
+
+        sign_list = [sign.strip() for sign in job_config.get('SIGNS', '>, <').split(',') if sign.strip()]
+        for sign in sign_list:
+            if sign not in SIGN_CODES:
+                logging.error(f'Неизвестный знак "{sign}" в [{section}] SIGNS, известные: {" ".join(SIGN_CODES)}')
+        sign_list = [sign for sign in sign_list if sign in SIGN_CODES] or ['>', '<']
+
+        markets = dict()
+        for sport in job_sport_list:
+            key = f'MARKET_{sport}' if f'MARKET_{sport}' in job_config else 'MARKET'
+            market = _parse_market(job_config.get(key), f'[{section}] {key}')
+            if market is not None:
+                markets[sport] = market
+        jobs.append(Job(name=name, sport_list=job_sport_list, sign_list=sign_list, markets=markets))
+    return jobs
 
 
 def read_settings() -> dict:
@@ -102,12 +380,51 @@ def read_settings() -> dict:
     - user_agent: User agent information
     - xguid_olimpbet: XGUID for https://www.olimp.bet/
     - user_ukey: User UKEY for https://www.olimp.bet/
+    - http_limit: максимальное количество одновременных соединений
+    - http_limit_per_host: максимальное количество одновременных соединений к одному сайту
+    - host_concurrency: одновременных запросов к одному сайту в очереди планировщика (0 - без планировщика)
+    - retry_tries, retry_backoff_base, retry_backoff_cap: попыток на запрос и задержка между ними (экспоненциальная)
+    - circuit_failures, circuit_reset: после скольких ошибок подряд отключать запросы к сайту и на сколько секунд
+    - hedge_requests: дублировать запрос, если ответ не пришел за p95 времени ответа сайта
+    - proxy_file: файл со списком прокси, по одному на строку (пусто - без прокси)
+    - proxy_ban_time: сколько секунд не использовать прокси после бана
+    - host_rate, host_burst: запросов в секунду к одному сайту (0 - без ограничения) и сколько запросов подряд
+    - dns_cache_ttl: время кэширования DNS, сек
+    - keepalive_timeout: время удержания неактивного соединения, сек
+    - daemon_mode: постоянный режим работы с периодическим опросом сайтов
+    - poll_interval_olimpbet: интервал опроса https://www.olimp.bet/ в постоянном режиме, сек
+    - poll_interval_olimpcom: интервал опроса https://www.olimp.com/ в постоянном режиме, сек
+    - parse_workers: количество процессов для разбора страниц матчей (0 - разбор в основном процессе)
+    - parser_engine: способ разбора страниц olimp.com (bs4 или lxml)
+    - json_engine: способ разбора ответа olimp.bet (json или stream)
+    - olimpbet_mode: способ получения данных olimp.bet (browser или hybrid)
+    - match_threshold: минимальная уверенность (0..1) сопоставления названий матчей на разных сайтах
+    - kickoff_window: допустимая разница времени начала матча на разных сайтах, сек
+    - pair_cache_path: файл найденных пар игр по идентификаторам сайтов между запусками (пусто - не сохранять)
+    - pair_cache_ttl: через сколько секунд после пропадения игры из списков удалять ее пару, сек
+    - replay_mode: off - обычная работа, record - запись ответов сайтов, replay - работа с записанными ответами
+    - replay_dir, replay_port, replay_latency, replay_jitter, replay_error_rate: настройки записи и воспроизведения
+    - metrics_enabled: сбор метрик работы (время запросов и разбора, объем, повторы, ошибки, количество совпадений)
+    - metrics_dir: папка для выгрузки метрик (metrics.json и metrics.prom)
+    - sport_list: виды спорта для сравнения (при заданиях - все виды спорта всех заданий)
+    - jobs: задания сравнения (src.jobs) из разделов [Job:<название>], без них - одно задание по [Settings]
+    - markets: вид спорта -> (группа исходов olimp.bet, исход olimp.com или None - исход по умолчанию)
+      для основного коэффициента
+    - market_groups: группы исходов olimp.bet, которые сохраняются при разборе (пустой список - все)
+    - compare_output: вывод сравнения с коэффициентами в постоянном режиме: full - все совпадения на каждом сравнении,
+      diff - только изменения с прошлого сравнения
+    - cache_size: для скольких адресов хранить последний ответ (условные запросы) и результат его разбора
+    - store_path: файл SQLite для истории коэффициентов (пусто - история не сохраняется)
+    - output: приемники результатов сравнения (log, jsonl, csv, stream - src.output)
+    - output_dir: папка для файлов jsonl и csv
+    - output_port: порт локального сервера WebSocket/SSE для stream
+    - browser_cdp_url: адрес работающего браузера для подключения по CDP вместо запуска Chromium (пусто - запуск)
     """
     config = ConfigParser(interpolation=None)
     config.read('config.ini', encoding='utf-8-sig')
 
     try:
-        get_coeffs = bool(distutils.util.strtobool(config['Settings']['GET_COEFFS']))
+        get_coeffs = _strtobool(config['Settings']['GET_COEFFS'])
     except KeyError:
         logging.info('Работа без сравнения коэффициентов!')
         get_coeffs = False
@@ -142,8 +459,162 @@ def read_settings() -> dict:
         logging.critical('Не задан USER_UKEY для https://www.olimp.bet/ Работа не возможна!')
         sys.exit()
 
+    try:
+        parser_engine = config['Settings']['PARSER_ENGINE'].strip().lower()
+    except KeyError:
+        parser_engine = 'bs4'
+    if parser_engine not in ('bs4', 'lxml'):
+        logging.error(f'Неизвестный PARSER_ENGINE "{parser_engine}", используется bs4')
+        parser_engine = 'bs4'
+
+    try:
+        json_engine = config['Settings']['JSON_ENGINE'].strip().lower()
+    except KeyError:
+        json_engine = 'json'
+    if json_engine not in ('json', 'stream'):
+        logging.error(f'Неизвестный JSON_ENGINE "{json_engine}", используется json')
+        json_engine = 'json'
+
+    try:
+        olimpbet_mode = config['Settings']['OLIMPBET_MODE'].strip().lower()
+    except KeyError:
+        olimpbet_mode = 'browser'
+    if olimpbet_mode not in ('browser', 'hybrid'):
+        logging.error(f'Неизвестный OLIMPBET_MODE "{olimpbet_mode}", используется browser')
+        olimpbet_mode = 'browser'
+
+    try:
+        replay_mode = config['Settings']['REPLAY_MODE'].strip().lower()
+    except KeyError:
+        replay_mode = 'off'
+    if replay_mode not in ('off', 'record', 'replay'):
+        logging.error(f'Неизвестный REPLAY_MODE "{replay_mode}", используется off')
+        replay_mode = 'off'
+
+    try:
+        replay_dir = config['Settings']['REPLAY_DIR']
+    except KeyError:
+        replay_dir = 'Data/replay'
+
+    try:
+        sport_list = _parse_sport_list(config['Settings']['SPORT_LIST'], 'SPORT_LIST') or ['Футбол']
+    except KeyError:
+        sport_list = ['Футбол']
+
+    markets = dict()
+    for sport in sport_list:
+        market = _parse_market(config['Settings'].get(f'MARKET_{sport}'), f'MARKET_{sport}')
+        if market is not None:
+            markets[sport] = market
+
+    try:
+        market_groups = [group.strip() for group in config['Settings']['MARKET_GROUPS'].split(',') if group.strip()]
+    except KeyError:
+        market_groups = []
+
+    jobs = _read_jobs(config, sport_list)
+    if jobs:
+        # данные запрашиваются один раз для всех видов спорта всех заданий
+        sport_list = list(dict.fromkeys(sport for job in jobs for sport in job.sport_list))
+        if market_groups:
+            market_groups += [group_name for job in jobs for group_name, _ in job.markets.values()]
+    else:
+        jobs = [Job(name='', sport_list=sport_list)]
+
+    try:
+        compare_output = config['Settings']['COMPARE_OUTPUT'].strip().lower()
+    except KeyError:
+        compare_output = 'full'
+    if compare_output not in ('full', 'diff'):
+        logging.error(f'Неизвестный COMPARE_OUTPUT "{compare_output}", используется full')
+        compare_output = 'full'
+
+    try:
+        proxy_file = config['Settings']['PROXY_FILE'].strip()
+    except KeyError:
+        proxy_file = ''
+
+    try:
+        metrics_dir = config['Settings']['METRICS_DIR']
+    except KeyError:
+        metrics_dir = 'Data/metrics'
+
+    try:
+        store_path = config['Settings']['STORE_PATH'].strip()
+    except KeyError:
+        store_path = ''
+
+    try:
+        output = [sink.strip().lower() for sink in config['Settings']['OUTPUT'].split(',') if sink.strip()]
+    except KeyError:
+        output = ['log']
+    for sink in output:
+        if sink not in SINKS:
+            logging.error(f'Неизвестный вывод "{sink}" в OUTPUT, известные: {", ".join(SINKS)}')
+    output = [sink for sink in output if sink in SINKS] or ['log']
+
+    try:
+        output_dir = config['Settings']['OUTPUT_DIR']
+    except KeyError:
+        output_dir = 'Data/output'
+
+    try:
+        browser_cdp_url = config['Settings']['BROWSER_CDP_URL'].strip()
+    except KeyError:
+        browser_cdp_url = ''
+
+    try:
+        pair_cache_path = config['Settings']['PAIR_CACHE_PATH'].strip()
+    except KeyError:
+        pair_cache_path = ''
+
     return {
         "get_coeffs": get_coeffs,
+        "sport_list": sport_list,
+        "markets": markets,
+        "jobs": jobs,
+        "market_groups": market_groups,
+        "compare_output": compare_output,
+        "store_path": store_path,
+        "output": output,
+        "output_dir": output_dir,
+        "output_port": _read_int(config, 'OUTPUT_PORT', 8790),
+        "browser_cdp_url": browser_cdp_url,
+        "cache_size": _read_int(config, 'CACHE_SIZE', 1024),
+        "metrics_enabled": _read_bool(config, 'METRICS_ENABLED', True),
+        "metrics_dir": metrics_dir,
+        "replay_mode": replay_mode,
+        "replay_dir": replay_dir,
+        "replay_port": _read_int(config, 'REPLAY_PORT', 8765),
+        "replay_latency": _read_float(config, 'REPLAY_LATENCY', 0.05),
+        "replay_jitter": _read_float(config, 'REPLAY_JITTER', 0.02),
+        "replay_error_rate": _read_float(config, 'REPLAY_ERROR_RATE', 0),
+        "olimpbet_mode": olimpbet_mode,
+        "parser_engine": parser_engine,
+        "json_engine": json_engine,
+        "http_limit": _read_int(config, 'HTTP_LIMIT', 100),
+        "http_limit_per_host": _read_int(config, 'HTTP_LIMIT_PER_HOST', 10),
+        "host_concurrency": _read_int(config, 'HOST_CONCURRENCY', 1),
+        "host_rate": _read_float(config, 'HOST_RATE', 0),
+        "host_burst": _read_int(config, 'HOST_BURST', 1),
+        "retry_tries": _read_int(config, 'RETRY_TRIES', 3),
+        "retry_backoff_base": _read_float(config, 'RETRY_BACKOFF_BASE', 0.5),
+        "retry_backoff_cap": _read_float(config, 'RETRY_BACKOFF_CAP', 10),
+        "circuit_failures": _read_int(config, 'CIRCUIT_FAILURES', 5),
+        "circuit_reset": _read_float(config, 'CIRCUIT_RESET', 30),
+        "hedge_requests": _read_bool(config, 'HEDGE_REQUESTS', False),
+        "proxy_file": proxy_file,
+        "proxy_ban_time": _read_float(config, 'PROXY_BAN_TIME', 300),
+        "dns_cache_ttl": _read_int(config, 'DNS_CACHE_TTL', 300),
+        "keepalive_timeout": _read_int(config, 'KEEPALIVE_TIMEOUT', 30),
+        "daemon_mode": _read_bool(config, 'DAEMON_MODE', False),
+        "poll_interval_olimpbet": _read_float(config, 'POLL_INTERVAL_OLIMPBET', 5),
+        "poll_interval_olimpcom": _read_float(config, 'POLL_INTERVAL_OLIMPCOM', 10),
+        "parse_workers": _read_int(config, 'PARSE_WORKERS', 0),
+        "match_threshold": _read_float(config, 'MATCH_THRESHOLD', 0.8),
+        "kickoff_window": _read_int(config, 'KICKOFF_WINDOW', 3 * 3600),
+        "pair_cache_path": pair_cache_path,
+        "pair_cache_ttl": _read_float(config, 'PAIR_CACHE_TTL', 600),
         "url_olimpcom": url_olimpcom,
         "url_olimpbet": url_olimpbet,
         "user_agent": user_agent,
@@ -154,44 +625,205 @@ def read_settings() -> dict:
 
 async def main():
     settings = read_settings()
+    METRICS.enabled = settings.get("metrics_enabled")
+    replay_mode = settings.get("replay_mode")
+    recorder = Recorder(settings.get("replay_dir")) if replay_mode == 'record' else None
+    server = None
+    if replay_mode == 'replay':
+        # вместо настоящих сайтов - локальный сервер с записанными ответами
+        server = ReplayServer(settings.get("replay_dir"),
+                              port=settings.get("replay_port"),
+                              latency=settings.get("replay_latency"),
+                              jitter=settings.get("replay_jitter"),
+                              error_rate=settings.get("replay_error_rate"))
+        await server.start()
+        settings = settings | {"url_olimpbet": server.local_url(settings.get("url_olimpbet")),
+                               "url_olimpcom": server.local_url(settings.get("url_olimpcom"))}
+
+    # по ТЗ - не больше одного запроса к сайту одновременно, остальные ждут в очереди по приоритету
+    scheduler = None
+    if settings.get("host_concurrency") > 0:
+        scheduler = RequestScheduler(limit_per_host=settings.get("host_concurrency"),
+                                     rate_per_host=settings.get("host_rate"),
+                                     burst=settings.get("host_burst"))
+    proxy_pool = None
+    if settings.get("proxy_file"):
+        proxy_pool = ProxyPool.from_file(settings.get("proxy_file"), ban_time=settings.get("proxy_ban_time"))
+        logging.info(f'Загружено прокси: {len(proxy_pool)}')
+    resilience = ResiliencePolicy(max_tries=settings.get("retry_tries"),
+                                  backoff_base=settings.get("retry_backoff_base"),
+                                  backoff_cap=settings.get("retry_backoff_cap"),
+                                  failure_threshold=settings.get("circuit_failures"),
+                                  reset_timeout=settings.get("circuit_reset"),
+                                  hedge=settings.get("hedge_requests"))
+    parse_workers = settings.get("parse_workers")
+    executor = ProcessPoolExecutor(max_workers=parse_workers) if parse_workers > 0 else None
+    # история коэффициентов пишется отдельным потоком
+    store = SnapshotStore(settings.get("store_path")) if settings.get("store_path") else None
+    # результаты выводятся через очередь, приемники не задерживают получение данных
+    output = make_output(settings.get("output"), settings.get("output_dir"), settings.get("output_port"))
+    await output.start()
+    start_time = time.perf_counter()
+    try:
+        # один пул соединений на все запросы к обоим сайтам
+        async with HttpClient(limit=settings.get("http_limit"),
+                              limit_per_host=settings.get("http_limit_per_host"),
+                              ttl_dns_cache=settings.get("dns_cache_ttl"),
+                              keepalive_timeout=settings.get("keepalive_timeout"),
+                              recorder=recorder,
+                              cache_size=settings.get("cache_size"),
+                              scheduler=scheduler,
+                              proxy_pool=proxy_pool,
+                              resilience=resilience) as client:
+            return await compare(settings, client, executor, store, output)
+    finally:
+        await output.close()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if store is not None:
+            store.close()
+        if recorder is not None:
+            recorder.save()
+        if server is not None:
+            await server.stop()
+        if replay_mode != 'off':
+            logging.info(benchmark_report(time.perf_counter() - start_time, server))
+        METRICS.export(settings.get("metrics_dir"))
+
+
+async def compare(settings: dict,
+                  client: HttpClient,
+                  executor: Executor | None = None,
+                  store: SnapshotStore | None = None,
+                  output: Output | None = None) -> OlimpCodes:
     olimp_bet = OlimpBet(url=settings.get("url_olimpbet"),
                          user_agent=settings.get("user_agent"),
                          timeout=30,
                          xguid_olimpbet=settings.get("xguid_olimpbet"),
                          user_ukey=settings.get("user_ukey"),
-                         sport_list=['Футбол'],
-                         coeff_name='Исход матча (основное время)')
+                         sport_list=settings.get("sport_list"),
+                         coeff_name=DEFAULT_MARKET[0],
+                         coeff_names={sport: market[0] for sport, market in settings.get("markets").items()},
+                         client=client,
+                         json_engine=settings.get("json_engine"),
+                         mode=settings.get("olimpbet_mode"),
+                         parse_cache_size=settings.get("cache_size"),
+                         market_groups=settings.get("market_groups"))
 
     olimp_com = OlimpCom(url=settings.get("url_olimpcom"),
                          user_agent=settings.get("user_agent"),
                          timeout=30,
-                         sport_list=['Футбол'],
-                         coeff_name='П1')
-
-    # вынес создание браузера сюда, т.к. возможно придется несколько раз получать страницу, и чтобы не пересоздавать
-    apw = await async_playwright().start()
-    browser = await apw.chromium.launch()
-    page = await browser.new_page()
-
-    get_coeffs = settings.get("get_coeffs")
-    olimps = await asyncio.gather(
-        olimp_bet.get_bets(page, is_need_coeffs=get_coeffs),
-        olimp_com.get_bets(is_need_coeffs=get_coeffs))
-    if not all([res.get("result") for res in olimps]):
-        logging.error('Не удалось получить информацию для сравнения')
-        return OlimpCodes.error_get_list
-    if not get_coeffs:
-        show_only_same_games([olimp.get("response") for olimp in olimps])
-    else:
-        show_same_games_with_coeffs([olimp.get("response") for olimp in olimps], sign_list=['>', '<'])
-    await browser.close()
+                         sport_list=settings.get("sport_list"),
+                         coeff_name=DEFAULT_MARKET[1],
+                         coeff_names={sport: market[1] for sport, market in settings.get("markets").items() if market[1]},
+                         client=client,
+                         executor=executor,
+                         parser_engine=settings.get("parser_engine"),
+                         parse_cache_size=settings.get("cache_size"),
+                         # в постоянном режиме страницы, не дождавшиеся очереди до следующего опроса, уже не нужны
+                         queue_deadline=settings.get("poll_interval_olimpcom") if settings.get("daemon_mode") else None)
 
+    # пары, найденные в прошлых запусках, сопоставляются по идентификаторам, по названиям - только новые игры
+    pair_cache = PairCache(settings.get("pair_cache_path"), ttl=settings.get("pair_cache_ttl")) \
+        if settings.get("pair_cache_path") else None
+    matcher = GameMatcher(threshold=settings.get("match_threshold"),
+                          kickoff_window=settings.get("kickoff_window"),
+                          pair_cache=pair_cache)
 
-if __name__ == "__main__":
+    # вынес создание браузера сюда, т.к. возможно придется несколько раз получать страницу, и чтобы не пересоздавать.
+    # Браузер запускается (или подключается по CDP) в фоне, одновременно с запросом списка olimp.com,
+    # которому он не нужен, и ожидается только при первом запросе к olimp.bet
+    browser = BrowserSession(settings.get("browser_cdp_url") or None)
+    browser.start()
     start_time = time.perf_counter()
-    set_logger()
+    try:
+        get_coeffs = settings.get("get_coeffs")
+        # все задания считаются по одним и тем же полученным и разобранным данным
+        jobs = settings.get("jobs")
+        if settings.get("daemon_mode"):
+            # у каждого задания свое состояние прошлого сравнения
+            engines = {job.name: DiffEngine() for job in jobs} if settings.get("compare_output") == 'diff' else None
+            daemon = CompareDaemon(olimp_bet, olimp_com, browser, matcher,
+                                   interval_olimpbet=settings.get("poll_interval_olimpbet"),
+                                   interval_olimpcom=settings.get("poll_interval_olimpcom"),
+                                   get_coeffs=get_coeffs,
+                                   metrics_dir=settings.get("metrics_dir"),
+                                   store=store,
+                                   on_compare=partial(show_jobs, jobs=jobs, get_coeffs=get_coeffs, matcher=matcher,
+                                                      output=output, engines=engines))
+            await daemon.run()
+            return OlimpCodes.ok
+
+        # сначала только списки игр, коэффициенты запрашиваем уже для совпадающих игр
+        olimps = await asyncio.gather(
+            olimp_bet.get_bets(browser, is_need_coeffs=False),
+            olimp_com.get_bets(is_need_coeffs=False))
+        if not all([res.get("result") for res in olimps]):
+            logging.error('Не удалось получить информацию для сравнения')
+            return OlimpCodes.error_get_list
+        logging.info(f'Списки игр обоих сайтов получены за {round(time.perf_counter() - start_time, 2)} сек')
+        if not get_coeffs:
+            with METRICS.timer("olimp_compare_seconds"):
+                show_jobs([olimp.get("response") for olimp in olimps], jobs, get_coeffs, matcher, output)
+            return OlimpCodes.ok
+
+        same_bet, same_com = get_same_games([olimp.get("response") for olimp in olimps], matcher)
+        logging.info(f'Количество совпадающих игр для получения коэффициентов = {len(same_com)}')
+        # коэффициенты olimp.bet уже есть в ответе API, поэтому игры сравниваются и выводятся пачками
+        # по мере получения их страниц на olimp.com, не дожидаясь остальных
+        res_bet = await olimp_bet.get_coefficients(same_bet)
+        if not res_bet.get("result"):
+            logging.error('Не удалось получить коэффициенты для сравнения')
+            return OlimpCodes.error_get_coeffs
+        batch = CoeffsBatch(res_bet.get("response"), jobs, output)
+        res_com = await olimp_com.get_coefficients(same_com, on_game=batch.add)
+        # последняя пачка - игры, полученные после предыдущего сравнения
+        batch.flush()
+        if not res_com.get("result"):
+            logging.error('Не удалось получить коэффициенты для сравнения')
+            return OlimpCodes.error_get_coeffs
+        batch.summary()
+        olimps = [res_bet, res_com]
+        if store is not None:
+            store.add_compare([olimp.get("response") for olimp in olimps])
+        return OlimpCodes.ok
+    finally:
+        await browser.close()
+        if pair_cache is not None:
+            pair_cache.close()
+
+
+def run_main():
+    """
+    Запуск main с остановкой по Ctrl+C и SIGTERM: сигнал отменяет задачу main, поэтому блоки finally
+    в main и compare выполняются - очередь вывода и история коэффициентов дописываются, кэш пар сохраняется,
+    браузер и пул процессов закрываются.
+    """
     # убрал asyncio.run(main(), т.к. при завершении работы была ошибка.
     # а если задать WindowsSelectorEventLoopPolicy, то не работал Playwright
     # asyncio.run(main())
-    asyncio.get_event_loop().run_until_complete(main())
+    loop = asyncio.get_event_loop()
+    task = loop.create_task(main())
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, task.cancel)
+        except NotImplementedError:
+            # в Windows у event loop нет обработчиков сигналов
+            signal.signal(signum, lambda *args: loop.call_soon_threadsafe(task.cancel))
+    try:
+        loop.run_until_complete(task)
+    except KeyboardInterrupt:
+        # сигнал пришел не в обработчик - задача еще не отменена
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            loop.run_until_complete(task)
+        logging.info('Работа остановлена')
+    except asyncio.CancelledError:
+        logging.info('Работа остановлена')
+
+
+if __name__ == "__main__":
+    start_time = time.perf_counter()
+    set_logger()
+    run_main()
     logging.info(f'Работа завершена. Затраченное время: {round(time.perf_counter() - start_time, 2)} сек')
@@ -0,0 +1,196 @@
+"""
+Браузер для olimp.bet: запускается в фоне при старте, пока идут запросы, которым браузер не нужен (olimp.com),
+и ожидается только там, где нужна страница. Playwright импортируется только при запуске браузера.
+
+Повторные запуски могут не запускать Chromium, а подключаться по CDP к уже работающему постоянному браузеру
+(BROWSER_CDP_URL в config.ini). В нем же сохраняются cookies между запусками. Постоянный браузер:
+    python -m src.browser serve [порт, по умолчанию 9222] [папка профиля, по умолчанию Data/browser]
+Сравнение времени готовности страницы при запуске Chromium (холодный старт) и подключении по CDP (теплый):
+    python -m src.browser bench [количество запусков, по умолчанию 3]
+"""
+import asyncio
+import logging
+import sys
+import time
+from typing import TYPE_CHECKING
+
+from src.metrics import METRICS
+
+if TYPE_CHECKING:
+    from playwright.async_api import Page
+
+my_log = logging.getLogger(__name__)
+
+DEFAULT_CDP_PORT = 9222
+DEFAULT_PROFILE_DIR = 'Data/browser'
+
+
+def log(s, is_error: bool = False):
+    msg = f'[BROWSER] -> {s}'
+    if not is_error:
+        my_log.info(msg)
+    else:
+        my_log.error(msg)
+
+
+class BrowserSession:
+    def __init__(self, cdp_url: str | None = None):
+        """
+        :param cdp_url: адрес работающего браузера (http://127.0.0.1:9222). Если не задан или подключиться
+            не удалось - запускается новый Chromium
+        """
+        self.cdp_url = cdp_url
+        self.is_attached = False
+        self.startup_seconds: float | None = None
+        self._task: asyncio.Task | None = None
+        self._apw = None
+        self._browser = None
+        self._page = None
+
+    def start(self) -> asyncio.Task:
+        """
+        Запуск браузера в фоне, повторный вызов возвращает ту же задачу.
+        """
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._start())
+        return self._task
+
+    async def get_page(self) -> 'Page':
+        page = await self._wait_start()
+        if page.is_closed() or not self._browser.is_connected():
+            # страницу или браузер закрыли (упал Chromium, перезапущен постоянный браузер) - запускаем заново
+            log('Страница браузера закрыта, перезапуск...', is_error=True)
+            await self.close()
+            page = await self._wait_start()
+        return page
+
+    async def _wait_start(self) -> 'Page':
+        task = self.start()
+        try:
+            # shield: отмена одного из ожидающих не должна отменять запуск браузера для остальных
+            return await asyncio.shield(task)
+        except BaseException:
+            # неудачный запуск не запоминается, следующий вызов запустит браузер заново.
+            # Если отменен только ожидающий, запуск продолжается
+            if task.done() and self._task is task:
+                self._task = None
+            raise
+
+    async def _start(self) -> 'Page':
+        from playwright.async_api import async_playwright
+
+        start_time = time.perf_counter()
+        self._apw = await async_playwright().start()
+        try:
+            if self.cdp_url:
+                try:
+                    self._browser = await self._apw.chromium.connect_over_cdp(self.cdp_url)
+                    # контекст постоянного браузера - с его cookies
+                    contexts = self._browser.contexts
+                    context = contexts[0] if contexts else await self._browser.new_context()
+                    self._page = await context.new_page()
+                    self.is_attached = True
+                except Exception as e:
+                    log(f'Не удалось подключиться к браузеру {self.cdp_url}: {e}. Запускается новый', is_error=True)
+                    self._browser = None
+            if self._page is None:
+                self._browser = await self._apw.chromium.launch()
+                self._page = await self._browser.new_page()
+        except BaseException:
+            if self._browser is not None and not self.is_attached:
+                await self._browser.close()
+            await self._apw.stop()
+            self._apw = self._browser = self._page = None
+            self.is_attached = False
+            raise
+
+        self.startup_seconds = time.perf_counter() - start_time
+        mode = 'cdp' if self.is_attached else 'launch'
+        METRICS.observe("olimp_browser_startup_seconds", self.startup_seconds, mode=mode)
+        log(f'Браузер готов за {round(self.startup_seconds, 2)} сек '
+            f'({"подключение к работающему браузеру" if self.is_attached else "запуск Chromium"})')
+        return self._page
+
+    async def close(self):
+        if self._task is None:
+            return
+        if not self._task.done():
+            self._task.cancel()
+        try:
+            await self._task
+        except BaseException:
+            pass
+        self._task = None
+        try:
+            if self._page is not None and self.is_attached:
+                # постоянный браузер продолжает работать, закрывается только своя вкладка
+                await self._page.close()
+            elif self._browser is not None:
+                await self._browser.close()
+        except Exception as e:
+            # браузер мог уже упасть или отключиться
+            log(f'Ошибка закрытия браузера: {e}', is_error=True)
+        if self._apw is not None:
+            await self._apw.stop()
+        self._apw = self._browser = self._page = None
+        self.is_attached = False
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+async def serve(port: int = DEFAULT_CDP_PORT, profile_dir: str = DEFAULT_PROFILE_DIR):
+    """
+    Постоянный браузер с профилем на диске, к которому подключаются запуски с BROWSER_CDP_URL.
+    """
+    from playwright.async_api import async_playwright
+
+    async with async_playwright() as apw:
+        await apw.chromium.launch_persistent_context(profile_dir, args=[f'--remote-debugging-port={port}'])
+        log(f'Браузер работает, BROWSER_CDP_URL = http://127.0.0.1:{port} (остановка - Ctrl+C)')
+        await asyncio.Event().wait()
+
+
+async def _measure_startup(cdp_url: str | None) -> float:
+    browser = BrowserSession(cdp_url)
+    try:
+        await browser.get_page()
+        return browser.startup_seconds
+    finally:
+        await browser.close()
+
+
+async def bench(repeat: int = 3, port: int = DEFAULT_CDP_PORT):
+    """
+    Время до готовой страницы: запуск нового Chromium и подключение по CDP к работающему браузеру.
+    """
+    from playwright.async_api import async_playwright
+
+    cold = [await _measure_startup(None) for _ in range(repeat)]
+    async with async_playwright() as apw:
+        context = await apw.chromium.launch_persistent_context(f'{DEFAULT_PROFILE_DIR}-bench',
+                                                               args=[f'--remote-debugging-port={port}'])
+        try:
+            warm = [await _measure_startup(f'http://127.0.0.1:{port}') for _ in range(repeat)]
+        finally:
+            await context.close()
+    print(f'Холодный старт (запуск Chromium): {round(sum(cold) / repeat, 3)} сек (по запускам: '
+          f'{", ".join(str(round(seconds, 3)) for seconds in cold)})')
+    print(f'Теплый старт (подключение по CDP): {round(sum(warm) / repeat, 3)} сек (по запускам: '
+          f'{", ".join(str(round(seconds, 3)) for seconds in warm)})')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'serve':
+        asyncio.run(serve(int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_CDP_PORT,
+                          sys.argv[3] if len(sys.argv) > 3 else DEFAULT_PROFILE_DIR))
+    elif command == 'bench':
+        asyncio.run(bench(int(sys.argv[2]) if len(sys.argv) > 2 else 3))
+    else:
+        print(__doc__)
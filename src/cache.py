@@ -0,0 +1,73 @@
+"""
+Кэши для повторного опроса сайтов: ответы с валидаторами для условных GET-запросов (ETag/Last-Modified)
+и результаты разбора по хешу тела ответа. Оба ограничены по количеству адресов (LRU),
+поэтому при постоянном опросе память не растет.
+"""
+import hashlib
+from collections import OrderedDict
+
+from src.metrics import METRICS
+
+
+def body_hash(body: str | bytes) -> str:
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 1024):
+        """
+        :param maxsize: максимальное количество записей (0 - кэш отключен)
+        """
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._items[key]
+        except KeyError:
+            return default
+        self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class ParseCache:
+    """
+    Последний результат разбора по каждому источнику (адресу) вместе с хешем тела ответа.
+    Если тело не изменилось - разбор не нужен, возвращается сохраненный результат.
+    Результаты общие для всех вызовов, поэтому записи игр (src.records) после разбора не изменяются:
+    коэффициенты каждого цикла записываются в новые записи (get_coefficients сайтов).
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self._items = LRUCache(maxsize)
+
+    def get(self, source: str, digest: str, stage: str):
+        """
+        :param digest: body_hash тела ответа
+        :param stage: этап разбора для метрик (olimpbet_list, olimpcom_coeffs, ...)
+        :return: сохраненный результат разбора или None, если тело ответа другое
+        """
+        cached = self._items.get(source)
+        if cached is not None and cached[0] == digest:
+            METRICS.inc("olimp_parse_cache_total", stage=stage, result='hit')
+            return cached[1]
+        METRICS.inc("olimp_parse_cache_total", stage=stage, result='miss')
+        return None
+
+    def put(self, source: str, digest: str, result):
+        # неудачный разбор не сохраняем, для него и так вернется None
+        if result:
+            self._items.put(source, (digest, result))
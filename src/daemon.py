@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from typing import Callable
+
+from src.browser import BrowserSession
+from src.matching import GameMatcher, get_same_games
+from src.metrics import METRICS
+from src.olimp_bet import OlimpBet
+from src.olimp_com import OlimpCom
+from src.storage import SnapshotStore
+
+my_log = logging.getLogger(__name__)
+
+
+def log(s, is_error: bool = False):
+    msg = f'[DAEMON] -> {s}'
+    if not is_error:
+        my_log.info(msg)
+    else:
+        my_log.error(msg)
+
+
+class CompareDaemon:
+    """
+    Постоянный режим работы: браузер, страница и пул соединений остаются открытыми,
+    каждый сайт опрашивается со своим интервалом, после каждого обновления выводится свежее сравнение.
+    Сравнение всегда идет по последним полученным данным обоих сайтов.
+    """
+
+    def __init__(self,
+                 olimp_bet: OlimpBet,
+                 olimp_com: OlimpCom,
+                 browser: BrowserSession,
+                 matcher: GameMatcher,
+                 interval_olimpbet: float,
+                 interval_olimpcom: float,
+                 get_coeffs: bool,
+                 on_compare: Callable[[list[dict, dict]], None],
+                 metrics_dir: str | None = None,
+                 store: SnapshotStore | None = None):
+        """
+        :param on_compare: вызывается после каждого обновления с последними данными [olimp.bet, olimp.com]
+        :param metrics_dir: папка, в которую метрики выгружаются после каждого сравнения (None - не выгружать)
+        :param store: история коэффициентов, в нее после каждого сравнения ставится снимок (None - не сохранять)
+        """
+        self.olimp_bet = olimp_bet
+        self.olimp_com = olimp_com
+        self.browser = browser
+        self.matcher = matcher
+        self.interval_olimpbet = interval_olimpbet
+        self.interval_olimpcom = interval_olimpcom
+        self.get_coeffs = get_coeffs
+        self.on_compare = on_compare
+        self.metrics_dir = metrics_dir
+        self.store = store
+
+        # последние полученные списки игр и игры с коэффициентами
+        self.games = {"olimp.bet": None, "olimp.com": None}
+        self.coeffs = {"olimp.bet": dict(), "olimp.com": dict()}
+
+    async def run(self):
+        """
+        Опрос сайтов до отмены задачи.
+        """
+        log(f'Запуск постоянного режима: olimp.bet каждые {self.interval_olimpbet} сек, '
+            f'olimp.com каждые {self.interval_olimpcom} сек')
+        try:
+            await asyncio.gather(
+                self._poll(self.interval_olimpbet, self._update_olimpbet),
+                self._poll(self.interval_olimpcom, self._update_olimpcom))
+        except asyncio.CancelledError:
+            # остановка по сигналу (olimp_compare.run_main): закрытие ресурсов - в finally вызывающего кода
+            log('Остановка постоянного режима')
+            raise
+
+    @staticmethod
+    async def _poll(interval: float, update: Callable):
+        while True:
+            start_time = time.perf_counter()
+            try:
+                await update()
+            except Exception as e:
+                log(f'Ошибка обновления: {e}', is_error=True)
+            # интервал считается от начала цикла, чтобы длительность запросов не сдвигала расписание
+            await asyncio.sleep(max(0.0, interval - (time.perf_counter() - start_time)))
+
+    async def _update_olimpbet(self):
+        start_time = time.perf_counter()
+        res = await self.olimp_bet.get_bets(self.browser, is_need_coeffs=False)
+        if not res.get("result"):
+            return
+        self.games["olimp.bet"] = res.get("response")
+
+        if self.get_coeffs and self.games["olimp.com"] is not None:
+            same_bet, _ = get_same_games([self.games["olimp.bet"], self.games["olimp.com"]], self.matcher)
+            res = await self.olimp_bet.get_coefficients(same_bet)
+            if not res.get("result"):
+                return
+            self.coeffs["olimp.bet"] = res.get("response")
+
+        log(f'olimp.bet обновлен за {round(time.perf_counter() - start_time, 2)} сек')
+        self._compare('olimp.bet')
+
+    async def _update_olimpcom(self):
+        start_time = time.perf_counter()
+        res = await self.olimp_com.get_bets(is_need_coeffs=False)
+        if not res.get("result"):
+            return
+        self.games["olimp.com"] = res.get("response")
+
+        if self.get_coeffs and self.games["olimp.bet"] is not None:
+            _, same_com = get_same_games([self.games["olimp.bet"], self.games["olimp.com"]], self.matcher)
+            res = await self.olimp_com.get_coefficients(same_com)
+            if not res.get("result"):
+                return
+            self.coeffs["olimp.com"] = res.get("response")
+
+        log(f'olimp.com обновлен за {round(time.perf_counter() - start_time, 2)} сек')
+        self._compare('olimp.com')
+
+    def _compare(self, site: str):
+        """
+        :param site: сайт, данные которого обновились (в историю пишется только его снимок)
+        """
+        if not all(games is not None for games in self.games.values()):
+            return
+        with METRICS.timer("olimp_compare_seconds"):
+            if self.get_coeffs:
+                self.on_compare([self.coeffs["olimp.bet"], self.coeffs["olimp.com"]])
+            else:
+                self.on_compare([self.games["olimp.bet"], self.games["olimp.com"]])
+        if self.get_coeffs and self.store is not None:
+            self.store.add_compare([self.coeffs["olimp.bet"], self.coeffs["olimp.com"]], sites=(site,))
+        if self.metrics_dir is not None:
+            METRICS.export(self.metrics_dir)
@@ -0,0 +1,125 @@
+"""
+Сравнение по изменениям: хранит прошлое состояние совпадающих игр и на каждом цикле выдает только
+добавленные и пропавшие матчи, изменившиеся коэффициенты и смену знака сравнения между сайтами.
+Каждой игре соответствует отпечаток коэффициентов обоих сайтов, неизменившиеся игры пропускаются
+сравнением отпечатков, без разбора исходов.
+"""
+from dataclasses import dataclass, field
+
+SIGN_CHARS = ('<', '=', '>')
+
+
+def sign(coeff: float | None, coeff_compare: float | None) -> str | None:
+    """
+    Знак сравнения коэффициентов двух сайтов, None - исхода нет на одном из сайтов.
+    """
+    if not coeff or not coeff_compare:
+        return None
+    return SIGN_CHARS[(coeff > coeff_compare) - (coeff < coeff_compare) + 1]
+
+
+def fingerprint(coeffs: dict, coeffs_compare: dict) -> int:
+    return hash((frozenset(coeffs.items()), frozenset(coeffs_compare.items())))
+
+
+@dataclass(slots=True)
+class OutcomeChange:
+    outcome: str
+    coeff_old: float | None
+    coeff: float | None
+    coeff_compare_old: float | None
+    coeff_compare: float | None
+
+    @property
+    def sign_old(self) -> str | None:
+        return sign(self.coeff_old, self.coeff_compare_old)
+
+    @property
+    def sign(self) -> str | None:
+        return sign(self.coeff, self.coeff_compare)
+
+    @property
+    def is_sign_flip(self) -> bool:
+        return self.sign_old is not None and self.sign is not None and self.sign_old != self.sign
+
+
+@dataclass(slots=True)
+class EventState:
+    fingerprint: int
+    coeffs: dict
+    coeffs_compare: dict
+
+
+@dataclass
+class CompareDelta:
+    """
+    added, removed - ключи совпадающих игр (названия olimp.com), changed - ключ -> изменившиеся исходы,
+    unchanged - сколько игр пропущено без изменений, unknown - сколько игр пропущено без коэффициентов
+    (страница не получена или не разобрана).
+    """
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    changed: dict[str, list[OutcomeChange]] = field(default_factory=dict)
+    unchanged: int = 0
+    unknown: int = 0
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    @property
+    def sign_flips(self) -> int:
+        return sum(change.is_sign_flip for changes in self.changed.values() for change in changes)
+
+
+class DiffEngine:
+    def __init__(self):
+        # ключ совпадающей игры -> коэффициенты обоих сайтов на прошлом цикле
+        self.state: dict[str, EventState] = dict()
+
+    def update(self, games: dict, games_compare: dict) -> CompareDelta:
+        """
+        Пустые коэффициенты одного из сайтов (ошибка запроса, дедлайн очереди, открытый предохранитель) -
+        состояние неизвестно: остается прошлое состояние игры, изменения не выдаются.
+        :param games: совпадающие игры одного сайта с заполненным coeffs
+        :param games_compare: те же игры другого сайта под теми же ключами
+        """
+        delta = CompareDelta()
+        state = dict()
+        for key, game in games.items():
+            game_compare = games_compare.get(key)
+            if game_compare is None:
+                continue
+            coeffs = game.coeffs
+            coeffs_compare = game_compare.coeffs
+            previous = self.state.get(key)
+            if not coeffs or not coeffs_compare:
+                if previous is not None:
+                    state[key] = previous
+                delta.unknown += 1
+                continue
+
+            current = EventState(fingerprint(coeffs, coeffs_compare), coeffs, coeffs_compare)
+            state[key] = current
+            if previous is None:
+                delta.added.append(key)
+            elif previous.fingerprint == current.fingerprint:
+                delta.unchanged += 1
+            else:
+                delta.changed[key] = self._changes(previous, current)
+
+        delta.removed = [key for key in self.state if key not in state]
+        self.state = state
+        return delta
+
+    @staticmethod
+    def _changes(previous: EventState, current: EventState) -> list[OutcomeChange]:
+        changes = []
+        outcomes = (previous.coeffs.keys() | current.coeffs.keys()
+                    | previous.coeffs_compare.keys() | current.coeffs_compare.keys())
+        for outcome in sorted(outcomes):
+            change = OutcomeChange(outcome,
+                                   previous.coeffs.get(outcome), current.coeffs.get(outcome),
+                                   previous.coeffs_compare.get(outcome), current.coeffs_compare.get(outcome))
+            if change.coeff_old != change.coeff or change.coeff_compare_old != change.coeff_compare:
+                changes.append(change)
+        return changes
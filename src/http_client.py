@@ -0,0 +1,97 @@
+import logging
+
+import aiohttp
+
+from src.cache import LRUCache
+from src.proxy_pool import ProxyPool
+from src.resilience import ResiliencePolicy
+from src.scheduler import RequestScheduler
+
+my_log = logging.getLogger(__name__)
+
+
+class HttpClient:
+    """
+    Общий HTTP-клиент на весь запуск: один пул соединений (keep-alive) с кэшем DNS
+    и ограничениями на общее количество соединений и на количество соединений к одному хосту.
+    Запросы сверх лимита ждут свободного соединения в очереди коннектора, а не открывают новые сокеты.
+    Для адресов, которые отдают ETag/Last-Modified, запоминается последний ответ, и повторный запрос
+    идет условным GET: при 304 тело не скачивается, возвращается сохраненное.
+    """
+
+    def __init__(self,
+                 limit: int = 100,
+                 limit_per_host: int = 10,
+                 ttl_dns_cache: int = 300,
+                 keepalive_timeout: int = 30,
+                 recorder=None,
+                 cache_size: int = 1024,
+                 scheduler: RequestScheduler | None = None,
+                 proxy_pool: ProxyPool | None = None,
+                 resilience: ResiliencePolicy | None = None):
+        """
+        :param recorder: src.replay.Recorder - если задан, все полученные ответы сохраняются на диск
+        :param cache_size: для скольких адресов хранить последний ответ для условных запросов (0 - не хранить)
+        :param scheduler: очередь запросов к каждому сайту (лимит одновременных запросов, частота, приоритет).
+            Если не задан - запросы ограничены только пулом соединений
+        :param proxy_pool: прокси для запросов, в которых прокси не задан явно (None - без прокси)
+        :param resilience: повторы с экспоненциальной задержкой, отключение недоступного сайта, дублирующие запросы
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.recorder = recorder
+        self.scheduler = scheduler
+        self.proxy_pool = proxy_pool
+        self.resilience = resilience
+        # адрес -> (ETag, Last-Modified, тело ответа)
+        self.validators = LRUCache(cache_size)
+        self._session: aiohttp.ClientSession | None = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit,
+                                             limit_per_host=self.limit_per_host,
+                                             ttl_dns_cache=self.ttl_dns_cache,
+                                             keepalive_timeout=self.keepalive_timeout)
+            # куки передаются явно в каждом запросе, общий cookie jar между сайтами не нужен
+            self._session = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar())
+        return self._session
+
+    def record(self, url: str, response: str | bytes | None):
+        if self.recorder is not None:
+            self.recorder.record(url, response)
+
+    def conditional_headers(self, url: str) -> tuple[dict, str | bytes | None]:
+        """
+        Заголовки условного запроса и тело, которое вернуть при ответе 304.
+        """
+        cached = self.validators.get(url)
+        if cached is None:
+            return dict(), None
+        etag, last_modified, body = cached
+        headers = dict()
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers, body
+
+    def remember(self, url: str, response_headers, body: str | bytes):
+        etag = response_headers.get('ETag')
+        last_modified = response_headers.get('Last-Modified')
+        if etag or last_modified:
+            self.validators.put(url, (etag, last_modified, body))
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,76 @@
+"""
+Задания сравнения: несколько наборов видов спорта, рынков и знаков в одном запуске (разделы [Job:<название>]
+в config.ini). Браузер, пул соединений и запросы общие: списки игр запрашиваются и разбираются один раз
+для всех видов спорта всех заданий, совпадения ищутся один раз, страница матча olimp.com запрашивается один раз,
+а каждое задание выбирает из общих данных свои игры и исходы.
+"""
+from dataclasses import dataclass, field, replace
+
+from src.markets import outcome_key
+from src.output import Output, log_record
+from src.records import Game
+
+
+@dataclass(slots=True)
+class Job:
+    """
+    name: название задания, добавляется в записи вывода (пустое - одно задание по [Settings], без названия)
+    sport_list: виды спорта задания
+    sign_list: допустимые к выводу знаки сравнения коэффициентов
+    markets: вид спорта -> (группа исходов olimp.bet, исход или None - все исходы группы),
+        для видов спорта без рынка сравниваются все исходы
+    """
+    name: str
+    sport_list: list[str]
+    sign_list: list[str] = field(default_factory=lambda: ['>', '<'])
+    markets: dict[str, tuple[str, str | None]] = field(default_factory=dict)
+
+    def apply(self, games: dict, games_compare: dict) -> list[dict, dict]:
+        """
+        Игры задания из общих совпадающих игр (одни и те же ключи у обоих сайтов).
+        Если для вида спорта задан рынок - копии записей только с его исходами, общие записи не меняются.
+        :param games: игры olimp.bet (по их исходам определяются исходы рынка)
+        :param games_compare: игры olimp.com под теми же ключами
+        """
+        selected, selected_compare = dict(), dict()
+        for name, game in games.items():
+            game_compare = games_compare.get(name)
+            if game.sport not in self.sport_list or game_compare is None:
+                continue
+            market = self.markets.get(game.sport)
+            if market is not None and game.coeffs is not None:
+                outcomes = self._market_outcomes(game, *market)
+                game, game_compare = self._only(game, outcomes), self._only(game_compare, outcomes)
+            selected[name], selected_compare[name] = game, game_compare
+        return [selected, selected_compare]
+
+    @staticmethod
+    def _only(game: Game, outcomes: set[str]) -> Game:
+        return replace(game, coeffs={key: coeff for key, coeff in (game.coeffs or {}).items() if key in outcomes})
+
+    @staticmethod
+    def _market_outcomes(game: Game, group_name: str, short_name: str | None) -> set[str]:
+        key = outcome_key(short_name) if short_name else None
+        return {outcome.key for outcome in game.outcomes
+                if outcome.group_name == group_name and (key is None or outcome.key == key)}
+
+
+class JobOutput:
+    """
+    Вывод записей задания: в каждую запись добавляется название задания.
+    """
+
+    def __init__(self, output: Output | None, name: str):
+        """
+        :param output: общая очередь вывода, если не задана - записи сразу выводятся в лог
+        """
+        self.output = output
+        self.name = name
+
+    def emit(self, record: dict):
+        if self.name:
+            record["job"] = self.name
+        if self.output is not None:
+            self.output.emit(record)
+        else:
+            log_record(record)
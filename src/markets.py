@@ -0,0 +1,124 @@
+"""
+Сравнение всех исходов рынков по совпадающим играм.
+Коэффициенты обоих сайтов раскладываются в выровненные таблицы NumPy (игры x исходы),
+маржа букмекера, лучший коэффициент по каждому исходу и процент вилки между сайтами
+считаются сразу для всех игр, без циклов по играм.
+NumPy импортируется только при построении таблицы: названия исходов (outcome_key) нужны и без сравнения коэффициентов.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+NO_PARAM = -9999.0
+# наборы исходов без параметра, которые вместе покрывают все варианты результата
+FULL_BOOKS = (
+    ("П1", "Х", "П2"),
+    ("1Х", "П2"),
+    ("П1", "Х2"),
+    ("12", "Х"),
+)
+# пары больше/меньше с одинаковым параметром: ТотБ(2.5) / ТотМ(2.5)
+RE_OVER = re.compile(r'^(?P<name>.*)Б\((?P<param>[^)]+)\)$')
+# пары фор: Фора 1(-1.5) / Фора 2(1.5)
+RE_HANDICAP = re.compile(r'^Фора 1\((?P<param>[^)]+)\)$')
+
+
+# названий исходов и параметров немного, а вызывается для каждого исхода каждой игры при разборе
+@lru_cache(maxsize=4096)
+def outcome_key(short_name: str, param: str | float | None = None) -> str:
+    """
+    Единое название исхода для обоих сайтов: латинская X -> кириллическая Х, параметр рынка в скобках.
+    """
+    name = short_name.strip().replace('X', 'Х').replace('x', 'Х')
+    try:
+        param = float(param)
+    except (TypeError, ValueError):
+        return name
+    if param == NO_PARAM:
+        return name
+    # -0.0 и 0.0 - один параметр
+    return f'{name}({param + 0.0:g})'
+
+
+@dataclass
+class MarketTable:
+    """
+    Выровненные коэффициенты совпадающих игр: строка - игра, столбец - исход, NaN - исхода нет на сайте.
+    """
+    keys: list[str]
+    outcomes: list[str]
+    coeffs: 'np.ndarray'
+    coeffs_compare: 'np.ndarray'
+
+    @classmethod
+    def from_games(cls, games: dict, games_compare: dict) -> 'MarketTable':
+        """
+        :param games: совпадающие игры одного сайта с заполненным coeffs (исход -> коэффициент)
+        :param games_compare: те же игры другого сайта под теми же ключами
+        """
+        import numpy as np
+
+        keys = [key for key in games if key in games_compare]
+        outcomes = sorted({outcome for key in keys for outcome in games[key].coeffs or {}})
+        columns = {outcome: i for i, outcome in enumerate(outcomes)}
+        coeffs = np.full((len(keys), len(outcomes)), np.nan)
+        coeffs_compare = np.full((len(keys), len(outcomes)), np.nan)
+        for row, key in enumerate(keys):
+            for table, game in ((coeffs, games[key]), (coeffs_compare, games_compare[key])):
+                for outcome, coeff in (game.coeffs or {}).items():
+                    column = columns.get(outcome)
+                    if column is not None and coeff:
+                        table[row, column] = coeff
+        return cls(keys=keys, outcomes=outcomes, coeffs=coeffs, coeffs_compare=coeffs_compare)
+
+    def books(self) -> list[tuple[str, list[int]]]:
+        """
+        Наборы исходов (название, индексы столбцов), по которым имеет смысл считать маржу и вилку.
+        """
+        columns = {outcome: i for i, outcome in enumerate(self.outcomes)}
+        books = []
+        for book in FULL_BOOKS:
+            if all(outcome in columns for outcome in book):
+                books.append(('/'.join(book), [columns[outcome] for outcome in book]))
+        for outcome in self.outcomes:
+            over = RE_OVER.match(outcome)
+            if over:
+                under = f'{over.group("name")}М({over.group("param")})'
+                if under in columns:
+                    books.append((f'{outcome}/{under}', [columns[outcome], columns[under]]))
+                continue
+            handicap = RE_HANDICAP.match(outcome)
+            if handicap:
+                other = outcome_key('Фора 2', -float(handicap.group("param")))
+                if other in columns:
+                    books.append((f'{outcome}/{other}', [columns[outcome], columns[other]]))
+        return books
+
+    def compare(self) -> dict:
+        """
+        Расчет для всех игр сразу:
+        - signs: знак сравнения коэффициентов по каждому исходу (1, -1, 0, NaN - исхода нет на одном из сайтов)
+        - best: лучший коэффициент по каждому исходу среди двух сайтов
+        - books: название набора исходов -> маржа обоих сайтов и процент вилки по каждой игре
+          (вилка > 0 - ставка на лучшие коэффициенты по всем исходам набора дает прибыль),
+          NaN - в игре нет хотя бы одного исхода набора на одном из сайтов
+        """
+        import numpy as np
+
+        signs = np.sign(self.coeffs - self.coeffs_compare)
+        best = np.fmax(self.coeffs, self.coeffs_compare)
+        books = dict()
+        for name, columns in self.books():
+            coeffs, coeffs_compare = self.coeffs[:, columns], self.coeffs_compare[:, columns]
+            # вилка по лучшим коэффициентам имеет смысл, только если все исходы набора есть на обоих сайтах
+            complete = ~(np.isnan(coeffs).any(axis=1) | np.isnan(coeffs_compare).any(axis=1))
+            books[name] = {
+                "margin": np.where(complete, (np.sum(1 / coeffs, axis=1) - 1) * 100, np.nan),
+                "margin_compare": np.where(complete, (np.sum(1 / coeffs_compare, axis=1) - 1) * 100, np.nan),
+                "arbitrage": np.where(complete, (1 - np.sum(1 / best[:, columns], axis=1)) * 100, np.nan),
+            }
+        return {"signs": signs, "best": best, "books": books}
@@ -0,0 +1,249 @@
+import re
+from collections import defaultdict
+from dataclasses import replace
+from difflib import SequenceMatcher
+
+from src.metrics import METRICS
+from src.pair_cache import PairCache
+from src.records import Game
+
+# варианты написания, приводимые к одному токену
+TOKEN_SYNONYMS = {
+    "ж": "жен",
+    "жен": "жен",
+    "женщины": "жен",
+    "w": "жен",
+    "women": "жен",
+    "рез": "рез",
+    "резерв": "рез",
+    "reserves": "рез",
+}
+# признаки команды: матчи с разными признаками (основа / женщины / резерв) - разные матчи
+QUALIFIERS = set(TOKEN_SYNONYMS.values())
+# латиница -> кириллица, сначала буквосочетания
+TRANSLIT = (
+    ("shch", "щ"), ("sch", "щ"), ("sh", "ш"), ("ch", "ч"), ("zh", "ж"), ("kh", "х"), ("ts", "ц"),
+    ("ya", "я"), ("yu", "ю"), ("yo", "е"), ("ye", "е"),
+    ("a", "а"), ("b", "б"), ("c", "к"), ("d", "д"), ("e", "е"), ("f", "ф"), ("g", "г"), ("h", "х"),
+    ("i", "и"), ("j", "дж"), ("k", "к"), ("l", "л"), ("m", "м"), ("n", "н"), ("o", "о"), ("p", "п"),
+    ("q", "к"), ("r", "р"), ("s", "с"), ("t", "т"), ("u", "у"), ("v", "в"), ("w", "в"), ("x", "кс"),
+    ("y", "й"), ("z", "з"),
+)
+RE_LATIN = re.compile('|'.join(latin for latin, _ in TRANSLIT))
+TRANSLIT_MAP = dict(TRANSLIT)
+# дефис - разделитель команд только с пробелами вокруг (иначе это часть названия: Нью-Йорк), тире - всегда
+RE_DASHES = re.compile(r'\s+-\s+|\s*[\u2010-\u2015\u2212]\s*')
+RE_TOKENS = re.compile(r'\w+')
+
+
+def _transliterate(token: str) -> str:
+    return RE_LATIN.sub(lambda m: TRANSLIT_MAP[m.group(0)], token)
+
+
+def normalize_name(name: str) -> list[list[str]]:
+    """
+    Название матча -> токены команд: "Локомотив – Динамо (жен)" -> [["локомотив"], ["динамо", "жен"]].
+    Регистр, тире, пробелы, скобки, ё и латиница приводятся к одному виду.
+    """
+    name = name.lower().replace('ё', 'е')
+    teams = RE_DASHES.split(name, maxsplit=1)
+    result = []
+    for team in teams:
+        tokens = []
+        for token in RE_TOKENS.findall(team):
+            tokens.append(TOKEN_SYNONYMS.get(token) or _transliterate(token))
+        result.append(tokens)
+    return result
+
+
+def _team_similarity(tokens: list[str], tokens_compare: list[str]) -> float:
+    if tokens == tokens_compare:
+        return 1.0
+    if not tokens or not tokens_compare:
+        return 0.0
+    set_tokens, set_compare = set(tokens), set(tokens_compare)
+    if set_tokens & QUALIFIERS != set_compare & QUALIFIERS:
+        return 0.0
+    # одно название дополняет другое: "Зенит" и "Зенит СПб"
+    if set_tokens <= set_compare or set_compare <= set_tokens:
+        return 0.9
+    return SequenceMatcher(None, ' '.join(tokens), ' '.join(tokens_compare)).ratio()
+
+
+def _similarity(teams: list[list[str]], teams_compare: list[list[str]]) -> float:
+    """
+    Уверенность по самой непохожей команде: "Динамо Москва - Спартак" и "Динамо Киев - Спартак" - разные матчи.
+    """
+    if len(teams) != len(teams_compare):
+        return _team_similarity(sum(teams, []), sum(teams_compare, []))
+    return min(_team_similarity(team, team_compare) for team, team_compare in zip(teams, teams_compare))
+
+
+class GameMatcher:
+    """
+    Сопоставление игр двух сайтов по нормализованным названиям.
+    По играм одного сайта строится индекс токен -> игры, кандидаты для игры другого сайта берутся
+    только из игр с общими токенами (и, если данные есть у обоих сайтов, той же лиги и близкого времени начала),
+    поэтому сложность близка к линейной от количества игр, а не к полному перебору всех пар.
+    С кэшем пар (src.pair_cache) уже известные пары находятся по comp_id, по названиям сопоставляются только новые игры.
+    """
+
+    def __init__(self,
+                 threshold: float = 0.8,
+                 kickoff_window: int = 3 * 3600,
+                 max_token_games: int = 50,
+                 pair_cache: PairCache | None = None):
+        """
+        :param threshold: минимальная уверенность (0..1), с которой пара считается одним матчем
+        :param kickoff_window: допустимая разница времени начала матча, сек
+        :param max_token_games: токены, встречающиеся в большем количестве игр, не используются для поиска кандидатов
+        :param pair_cache: пары, найденные раньше (в том числе в прошлых запусках), comp_id games -> comp_id games_compare
+        """
+        self.threshold = threshold
+        self.kickoff_window = kickoff_window
+        self.max_token_games = max_token_games
+        self.pair_cache = pair_cache
+        # comp_id игр обоих сайтов, которые остались без пары в прошлый раз: пары между ними уже проверялись
+        self._unmatched: tuple[set, set] = (set(), set())
+
+    def match(self, games: dict, games_compare: dict) -> list[tuple[str, str, float]]:
+        """
+        Возвращает пары (название в games, название в games_compare, уверенность), каждая игра - не более чем в одной паре.
+        Игры сопоставляются только внутри одного вида спорта.
+        """
+        pairs = self._cached_pairs(games, games_compare)
+        if pairs:
+            used = {name for name, _, _ in pairs}
+            used_compare = {name_compare for _, name_compare, _ in pairs}
+            games = {name: game for name, game in games.items() if name not in used}
+            games_compare = {name: game for name, game in games_compare.items() if name not in used_compare}
+
+        if self.pair_cache is None:
+            candidates = self._sport_candidates(games, games_compare)
+        else:
+            # по названиям сравниваются только пары, в которых хотя бы одна игра появилась с прошлого раза
+            unmatched, unmatched_compare = self._unmatched
+            old = {name: game for name, game in games.items() if game.comp_id in unmatched}
+            new = {name: game for name, game in games.items() if game.comp_id not in unmatched}
+            new_compare = {name: game for name, game in games_compare.items()
+                           if game.comp_id not in unmatched_compare}
+            candidates = self._sport_candidates(new, games_compare) + self._sport_candidates(old, new_compare)
+
+        # жадное сопоставление один к одному, начиная с самых уверенных пар
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        used, used_compare = set(), set()
+        for confidence, name, name_compare in candidates:
+            if name in used or name_compare in used_compare:
+                continue
+            used.add(name)
+            used_compare.add(name_compare)
+            pairs.append((name, name_compare, round(confidence, 3)))
+            if self.pair_cache is not None:
+                self.pair_cache.put(games[name].comp_id, games_compare[name_compare].comp_id, round(confidence, 3))
+
+        if self.pair_cache is not None:
+            METRICS.inc("olimp_pair_cache_total", len(games), result='miss')
+            self._unmatched = ({game.comp_id for name, game in games.items() if name not in used},
+                               {game.comp_id for name, game in games_compare.items() if name not in used_compare})
+            self.pair_cache.expire()
+            self.pair_cache.save()
+        return pairs
+
+    def _sport_candidates(self, games: dict, games_compare: dict) -> list[tuple[float, str, str]]:
+        partitions = defaultdict(lambda: (dict(), dict()))
+        for name, game in games.items():
+            partitions[game.sport][0][name] = game
+        for name, game in games_compare.items():
+            partitions[game.sport][1][name] = game
+
+        candidates = []
+        for sport_games, sport_games_compare in partitions.values():
+            if sport_games and sport_games_compare:
+                candidates.extend(self._candidates(sport_games, sport_games_compare))
+        return candidates
+
+    def _cached_pairs(self, games: dict, games_compare: dict) -> list[tuple[str, str, float]]:
+        """
+        Пары из кэша, обе игры которых есть в текущих списках.
+        """
+        if self.pair_cache is None or not len(self.pair_cache):
+            return []
+        names_compare = {game.comp_id: name for name, game in games_compare.items()}
+        pairs = []
+        for name, game in games.items():
+            cached = self.pair_cache.get(game.comp_id)
+            if cached is None:
+                continue
+            comp_id_compare, confidence = cached
+            name_compare = names_compare.pop(comp_id_compare, None)
+            if name_compare is None or confidence < self.threshold:
+                continue
+            self.pair_cache.touch(game.comp_id)
+            pairs.append((name, name_compare, confidence))
+        METRICS.inc("olimp_pair_cache_total", len(pairs), result='hit')
+        return pairs
+
+    def _candidates(self, games: dict, games_compare: dict) -> list[tuple[float, str, str]]:
+        """
+        Все пары с уверенностью не ниже порога: (уверенность, название в games, название в games_compare).
+        """
+        # ключ игры может содержать вид спорта (src.sports.game_key), сопоставляется само название
+        teams_compare = {name: normalize_name(game.comp_name or name) for name, game in games_compare.items()}
+        exact_compare = {self._key(teams): name for name, teams in teams_compare.items()}
+        index = defaultdict(list)
+        for name, teams in teams_compare.items():
+            for token in set(sum(teams, [])):
+                index[token].append(name)
+
+        candidates = []
+        for name, game in games.items():
+            teams = normalize_name(game.comp_name or name)
+            name_compare = exact_compare.get(self._key(teams))
+            if name_compare is not None and self._is_compatible(game, games_compare[name_compare]):
+                candidates.append((1.0, name, name_compare))
+                continue
+
+            names_compare = set()
+            for token in set(sum(teams, [])):
+                token_games = index.get(token, [])
+                if len(token_games) <= self.max_token_games:
+                    names_compare.update(token_games)
+            for name_compare in names_compare:
+                if not self._is_compatible(game, games_compare[name_compare]):
+                    continue
+                confidence = _similarity(teams, teams_compare[name_compare])
+                if confidence >= self.threshold:
+                    candidates.append((confidence, name, name_compare))
+        return candidates
+
+    @staticmethod
+    def _key(teams: list[list[str]]) -> str:
+        return ' - '.join(' '.join(team) for team in teams)
+
+    def _is_compatible(self, game: Game, game_compare: Game) -> bool:
+        competition, competition_compare = game.competition, game_compare.competition
+        if competition and competition_compare and competition != competition_compare:
+            return False
+        start_ts, start_ts_compare = game.start_ts, game_compare.start_ts
+        if start_ts and start_ts_compare and abs(start_ts - start_ts_compare) > self.kickoff_window:
+            return False
+        return True
+
+
+def get_same_games(olimps: list[dict, dict], matcher: GameMatcher | None = None) -> list[dict, dict]:
+    """
+    Возвращает для каждого сайта только те игры, которые есть на обоих сайтах.
+    Игры обоих сайтов возвращаются под названием с olimp.com, чтобы совпадающие игры были под одним ключом,
+    уверенность сопоставления match_confidence записывается в новые записи текущего цикла (dataclasses.replace):
+    записи из кэша разбора общие для всех циклов и не изменяются.
+    :param olimps: список полученных игр для заданных сайтов (olimp.bet, olimp.com)
+    :param matcher: способ сопоставления названий, по умолчанию GameMatcher с настройками по умолчанию
+    """
+    olimp_bet, olimp_com = olimps
+    matcher = matcher or GameMatcher()
+    same_bet, same_com = dict(), dict()
+    for name_com, name_bet, confidence in matcher.match(olimp_com, olimp_bet):
+        same_bet[name_com] = replace(olimp_bet[name_bet], match_confidence=confidence)
+        same_com[name_com] = replace(olimp_com[name_com], match_confidence=confidence)
+    METRICS.set("olimp_matched_games", len(same_com))
+    return [same_bet, same_com]
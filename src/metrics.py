@@ -0,0 +1,162 @@
+"""
+Метрики работы: счетчики, текущие значения и гистограммы времени этапов
+(запросы, загрузка страницы браузером, разбор, сравнение) с выгрузкой в JSON и текстовый формат Prometheus.
+При выключенных метриках все вызовы сразу возвращаются, таймер - общий пустой контекстный менеджер.
+"""
+import json
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+# границы корзин гистограмм времени, сек
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+NULL_TIMER = nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        # последняя корзина - значения больше всех границ (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "buckets": dict(zip([str(bucket) for bucket in self.buckets] + ['+Inf'], self.counts)),
+            "sum": round(self.sum, 6),
+            "count": self.count,
+        }
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+
+def _labels_text(labels: tuple, extra: dict | None = None) -> str:
+    pairs = list(labels) + list((extra or {}).items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metrics:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.counters = dict()
+        self.gauges = dict()
+        self.histograms = dict()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        self.gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def timer(self, name: str, **labels):
+        """
+        Время выполнения блока -> гистограмма name.
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        return self._timer(name, labels)
+
+    @contextmanager
+    def _timer(self, name: str, labels: dict):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time, **labels)
+
+    def total(self, name: str) -> float:
+        """
+        Сумма счетчика по всем меткам.
+        """
+        return sum(value for (counter_name, _), value in self.counters.items() if counter_name == name)
+
+    def histogram_sums(self, name: str) -> dict[tuple, float]:
+        """
+        Суммарное время гистограммы name по каждому набору меток.
+        """
+        return {labels: histogram.sum for (histogram_name, labels), histogram in self.histograms.items()
+                if histogram_name == name}
+
+    def reset(self):
+        self.counters.clear()
+        self.gauges.clear()
+        self.histograms.clear()
+
+    def to_dict(self) -> dict:
+        def items(values: dict, convert=lambda value: value) -> list:
+            return [{"name": name, "labels": dict(labels), "value": convert(value)}
+                    for (name, labels), value in sorted(values.items())]
+
+        return {
+            "counters": items(self.counters),
+            "gauges": items(self.gauges),
+            "histograms": items(self.histograms, Histogram.to_dict),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        typed = set()
+
+        def add_type(name: str, metric_type: str):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} {metric_type}')
+
+        for (name, labels), value in sorted(self.counters.items()):
+            add_type(name, 'counter')
+            lines.append(f'{name}{_labels_text(labels)} {value}')
+        for (name, labels), value in sorted(self.gauges.items()):
+            add_type(name, 'gauge')
+            lines.append(f'{name}{_labels_text(labels)} {value}')
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            add_type(name, 'histogram')
+            cumulative = 0
+            for bucket, count in zip([str(bucket) for bucket in histogram.buckets] + ['+Inf'], histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels_text(labels, {"le": bucket})} {cumulative}')
+            lines.append(f'{name}_sum{_labels_text(labels)} {histogram.sum}')
+            lines.append(f'{name}_count{_labels_text(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path: str | Path):
+        """
+        Сохранение метрик в папку: metrics.json и metrics.prom (для node_exporter textfile collector и т.п.).
+        """
+        if not self.enabled:
+            return
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        (path / 'metrics.json').write_text(self.to_json(), encoding='utf-8')
+        (path / 'metrics.prom').write_text(self.to_prometheus(), encoding='utf-8')
+
+
+METRICS = Metrics()
@@ -1,13 +1,25 @@
+import asyncio
 import json
 import logging
+from dataclasses import replace
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
-from playwright.async_api import Page
-
+from src.browser import BrowserSession
+from src.cache import ParseCache, body_hash
+from src.http_client import HttpClient
+from src.metrics import METRICS
+from src.records import Game, make_outcomes, outcome_groups
+from src.resilience import backoff_delay
+from src.scheduler import PRIORITY_LIST
+from src.sports import DATA_SPORT, game_key
 from src.states import OlimpCodes
-from src.utils import get_playwright_no_context
+from src.utils import fetch_response, get_playwright_no_context, harvest_session
 
 my_log = logging.getLogger(__name__)
 
+RAW_RESPONSE_FILE = Path(__file__).resolve().parent.parent / 'Data' / 'raw_response.txt'
+
 
 def log(s, is_error: bool = False):
     msg = f'[OLIMPBET] -> {s}'
@@ -25,7 +37,26 @@ class OlimpBet:
                  user_ukey: str,
                  sport_list: list[str],
                  coeff_name: str,
-                 proxy: str | None = None):
+                 proxy: str | None = None,
+                 client: HttpClient | None = None,
+                 json_engine: str = 'json',
+                 mode: str = 'browser',
+                 parse_cache_size: int = 1024,
+                 coeff_names: dict[str, str] | None = None,
+                 market_groups: list[str] | None = None):
+        """
+        :param url: адрес API для одного вида спорта (vids[]=<код>:), для остальных видов из sport_list
+            подставляется их код (src.sports.DATA_SPORT)
+        :param coeff_name: группа исходов для сравнения по умолчанию
+        :param coeff_names: вид спорта -> группа исходов, если для него она другая
+        :param json_engine: json - разбор ответа целиком через json.loads,
+            stream - потоковый разбор только нужных видов спорта и полей (src.parsers)
+        :param mode: browser - каждый запрос через Playwright,
+            hybrid - браузер только для получения cookies, запросы к API напрямую через aiohttp
+        :param parse_cache_size: для скольких адресов хранить последний результат разбора (0 - не хранить)
+        :param market_groups: группы исходов, которые сохраняются при разборе для сравнения всех исходов
+            (группы coeff_name и coeff_names сохраняются всегда). None - все группы
+        """
         self.url = url
 
         self.headers = {
@@ -58,14 +89,37 @@ class OlimpBet:
         self.sport_list = sport_list
         self.coeff_name = coeff_name
         self.proxy = proxy
+        self.client = client
+        self.json_engine = json_engine
+        self.mode = mode
+        # если ответ API не изменился с прошлого опроса, повторно его не разбираем
+        self.parse_cache = ParseCache(parse_cache_size)
+        self.coeff_names = coeff_names or dict()
+        self.market_groups = outcome_groups(market_groups, coeff_name, *self.coeff_names.values())
+        # страница браузера одна на все виды спорта: загрузки через нее идут по очереди
+        self._browser_lock = asyncio.Lock()
+
+    def _get_games(self, games: list | str | bytes) -> dict | None:
+        if self.json_engine == 'stream' and isinstance(games, (str, bytes)):
+            # потоковый разбор (src.parsers, ijson) загружается только для этого способа разбора
+            from src.parsers import get_games_stream
+
+            try:
+                return get_games_stream(games, self.sport_list, self.market_groups)
+            except Exception as e:
+                log(f'Ошибка конвертирования в словарь ответа: {e}')
+                return None
 
-    def _get_games(self, games: list | str) -> dict | None:
         try:
-            if isinstance(games, str):
+            # в режиме hybrid тело ответа приходит байтами, из браузера - строкой
+            if isinstance(games, (str, bytes)):
                 games = json.loads(games.strip())
         except Exception as e:
             log(f'Ошибка конвертирования в словарь ответа: {e}')
             return None
+        if not isinstance(games, list):
+            log(f'Неожиданный формат ответа: {type(games).__name__} вместо списка операций')
+            return None
 
         all_games = dict()
         for operation in games:
@@ -80,15 +134,19 @@ class OlimpBet:
                         comp_name = event.get("name").strip()
                         comp_id = event.get("id").strip()
                         data_sport_name = event.get("sportName").strip()
-                        outcomes = event.get("outcomes")  # для дальнешего получения коэффициентов
-                        all_games[comp_name] = {
-                            "comp_name": comp_name,
-                            "comp_id": comp_id,
-                            "data_sport_name": data_sport_name,
-                            "outcomes": outcomes,
-                            "site": "olimp.bet",
-                        }
+                        all_games[comp_name] = Game(
+                            comp_name=comp_name,
+                            comp_id=comp_id,
+                            sport=data_sport_name,
+                            site="olimp.bet",
+                            # для сопоставления с играми другого сайта
+                            competition=(event.get("competitionName") or '').strip(),
+                            start_ts=event.get("startDateTime"),
+                            # для дальнешего получения коэффициентов
+                            outcomes=make_outcomes(event.get("outcomes"), self.market_groups),
+                        )
                     except Exception as e:
+                        METRICS.inc("olimp_parse_failures_total", stage="olimpbet_list_row")
                         log(f'Ошибка парсинга:\n{e}')
 
         return all_games
@@ -98,62 +156,168 @@ class OlimpBet:
         """
         Нужен для тестирования - явно задавать в файле готовый ответ содержимого страницы.
         """
-        with open(r'Data\raw_response.txt', encoding='utf-8') as file:
+        with open(RAW_RESPONSE_FILE, encoding='utf-8') as file:
             response = json.load(file)
         return response
 
     @staticmethod
-    def _extract_coeff(current_game: dict, coeff_name: str) -> (float | None, str | None):
-        outcomes = current_game.get("outcomes", [])
+    def _extract_coeff(current_game: Game, coeff_name: str) -> (float | None, str | None):
         coeff = None
         short_name = None
 
-        for outcome in outcomes:
-            group_name = outcome.get("groupName", "").strip()
-            if coeff_name == group_name:
-                short_name = outcome.get("shortName", "").strip()
-                try:
-                    coeff = float(outcome.get("probability"))
+        for outcome in current_game.outcomes:
+            if coeff_name == outcome.group_name:
+                short_name = outcome.short_name
+                if outcome.coeff is not None:
+                    coeff = outcome.coeff
                     break
-                except:
-                    pass
 
         return coeff, short_name
 
+    @staticmethod
+    def _extract_coeffs(current_game: Game) -> dict[str, float]:
+        """
+        Все сохраненные при разборе исходы игры: название исхода (с параметром рынка) -> коэффициент.
+        """
+        coeffs = dict()
+        for outcome in current_game.outcomes:
+            if outcome.coeff is not None and outcome.key not in coeffs:
+                coeffs[outcome.key] = outcome.coeff
+        return coeffs
+
     async def _get_all_coefficients(self, all_games: dict, coeff_name: str) -> dict | OlimpCodes:
         log('Получение списка коэффициентов...')
 
         games = dict()
-        for game_name, current_game in all_games.items():
-            coeff, short_name = self._extract_coeff(current_game, coeff_name)
-            games[game_name] = current_game | {"coeff": coeff, "coeff_name": coeff_name, "short_name": short_name}
+        with METRICS.timer("olimp_parse_seconds", stage="olimpbet_coeffs"):
+            for game_name, current_game in all_games.items():
+                # запись из кэша разбора общая для всех циклов и не изменяется, коэффициенты - в новой записи
+                game_coeff_name = self.coeff_names.get(current_game.sport, coeff_name)
+                coeff, short_name = self._extract_coeff(current_game, game_coeff_name)
+                games[game_name] = replace(current_game, coeff=coeff, coeff_name=game_coeff_name,
+                                           short_name=short_name, coeffs=self._extract_coeffs(current_game))
         return games
 
-    async def get_bets(self, page: Page, is_need_coeffs: bool = False) -> dict:
-        log('Получение информации для OlimpBet...')
+    @staticmethod
+    def _is_challenge(status: int, response: bytes) -> bool:
+        """
+        Вместо списка операций пришла страница проверки (антибот, капча и т.п.), ошибка сессии
+        (4xx, JSON-объект вида {"error": ...} у просроченных cookies) или пустое тело.
+        """
+        return 400 <= status < 500 or not response.lstrip().startswith(b'[')
 
-        # response = self._get_raw_response_from_file()  # для отладки работаем с сохраненным ранее ответом
+    def sport_url(self, sport: str) -> str:
+        """
+        Адрес API для вида спорта: в адресе из настроек заменяется код вида спорта в vids[].
+        """
+        code = DATA_SPORT.get(sport)
+        if code is None:
+            return self.url
+        parts = urlsplit(self.url)
+        query = [(key, f'{code}:' if key == 'vids[]' else value)
+                 for key, value in parse_qsl(parts.query, keep_blank_values=True)]
+        return urlunsplit(parts._replace(query=urlencode(query)))
 
-        response = None
-        for try_get in range(5):
-            # TODO: в случае ошибки получения ответа от сервера, сделать перебор прокси. вопрос - откуда берете прокси?
+    async def _get_browser_response(self, browser: BrowserSession, url: str) -> str:
+        page = await browser.get_page()
+        async with self._browser_lock:
+            response = await get_playwright_no_context(page=page, url=url)
+        if self.client is not None:
+            self.client.record(url, response)
+        return response
 
-            response = await get_playwright_no_context(page=page, url=self.url)
+    async def _get_response_hybrid(self, browser: BrowserSession, url: str) -> bytes | str | None:
+        if self.cookies is not None:
+            result = await fetch_response(url=url,
+                                          headers=self.headers,
+                                          cookies=self.cookies,
+                                          proxy=self.proxy,
+                                          timeout=self.timeout,
+                                          client=self.client,
+                                          as_bytes=True,
+                                          priority=PRIORITY_LIST,
+                                          # cookies выданы сессии, прокси не меняем, пока его не забанят
+                                          sticky_proxy=True,
+                                          with_status=True)
+            # None - ошибка сети, исчерпаны попытки или сайт отключен после ошибок (src.resilience):
+            # это не проверка, браузер тут не поможет
+            if result is None:
+                return None
+            status, response = result
+            if not self._is_challenge(status, response):
+                return response
+            log(f'API вернул проверку или ошибку сессии вместо данных (ответ {status}), '
+                f'обновление cookies через браузер...')
 
-            # response = await fetch_response(url=self.url,
-            #                                 headers=self.headers,
-            #                                 cookies=self.cookies,
-            #                                 proxy=self.proxy,
-            #                                 timeout=self.timeout)
+        # браузер нужен только для прохождения проверки и получения cookies,
+        # ответ этой загрузки используется как результат текущего запроса
+        page = await browser.get_page()
+        async with self._browser_lock:
+            response = await get_playwright_no_context(page=page, url=url)
+            self.cookies, user_agent = await harvest_session(page, url)
+        if self.client is not None:
+            self.client.record(url, response)
+        # cookies выданы под User-Agent браузера, сжатие - только поддерживаемое aiohttp
+        self.headers = self.headers | {'User-Agent': user_agent, 'Accept-Encoding': 'gzip, deflate'}
+        return response
+
+    async def _get_sport_games(self, browser: BrowserSession, sport: str) -> dict | None:
+        """
+        Игры одного вида спорта: None - ответ не получен, пустой словарь - ответ не удалось разобрать.
+        """
+        url = self.sport_url(sport)
+        response = None
+        policy = self.client.resilience if self.client is not None else None
+        # в режиме hybrid повторы, задержки и отключение сайта после ошибок - в fetch_response (src.resilience),
+        # второй слой повторов поверх них не нужен. Загрузки через браузер повторяются здесь по той же политике
+        max_tries = 1 if self.mode == 'hybrid' else policy.max_tries if policy is not None else 5
+        for try_get in range(1, max_tries + 1):
+            if try_get > 1:
+                await asyncio.sleep(policy.backoff(try_get) if policy is not None else backoff_delay(try_get))
+
+            try:
+                if self.mode == 'hybrid':
+                    response = await self._get_response_hybrid(browser, url)
+                else:
+                    response = await self._get_browser_response(browser, url)
+            except Exception as e:
+                log(f'Ошибка получения ответа для "{sport}" (попытка {try_get}): {e}', is_error=True)
+                continue
             if response:
                 break
 
         if not response:
+            return None
+
+        digest = body_hash(response)
+        games = self.parse_cache.get(url, digest, stage='olimpbet_list')
+        if games is None:
+            with METRICS.timer("olimp_parse_seconds", stage="olimpbet_list"):
+                games = self._get_games(response)
+            self.parse_cache.put(url, digest, games)
+        if not games:
+            METRICS.inc("olimp_parse_failures_total", stage="olimpbet_list")
+            log(f'Нет игр для "{sport}", возможно сменилась верстка на сайте...')
+        return games or dict()
+
+    async def get_bets(self, browser: BrowserSession, is_need_coeffs: bool = False) -> dict:
+        """
+        :param browser: браузер ожидается только тогда, когда нужна страница (в режиме hybrid - для получения cookies)
+        """
+        log('Получение информации для OlimpBet...')
+
+        # response = self._get_raw_response_from_file()  # для отладки работаем с сохраненным ранее ответом
+
+        # у API отдельный адрес на каждый вид спорта, ответы запрашиваются и разбираются одновременно
+        results = await asyncio.gather(*[self._get_sport_games(browser, sport) for sport in self.sport_list])
+        if all(games is None for games in results):
             return {"result": False, "response": OlimpCodes.error_response}
 
-        all_games = self._get_games(response)
+        all_games = dict()
+        for games in results:
+            for name, game in (games or {}).items():
+                all_games[game_key(all_games, name, game.sport)] = game
         if not all_games:
-            log('Возможно сменилась верстка на сайте...')
             return {"result": False, "response": OlimpCodes.error_games_pars}
 
         log(f'Количество игр на странице = {len(all_games)}')
@@ -161,8 +325,20 @@ class OlimpBet:
         if not is_need_coeffs:
             return {"result": True, "response": all_games}
 
+        return await self.get_coefficients(all_games)
+
+    async def get_coefficients(self, all_games: dict) -> dict:
+        """
+        Получение коэффициентов только для переданных игр.
+        Вызывается уже после сравнения списков игр с olimp.com, чтобы не разбирать коэффициенты матчей,
+        которых нет на другом сайте.
+        :param all_games: игры (результат get_bets без коэффициентов), для которых нужны коэффициенты
+        """
+        if not all_games:
+            return {"result": True, "response": dict()}
+
         games = await self._get_all_coefficients(all_games, coeff_name=self.coeff_name)
-        if not games:
+        if not games or isinstance(games, OlimpCodes):
             log('Возможно сменилась верстка на сайте...')
             return {"result": False, "response": OlimpCodes.error_get_coeffs}
 
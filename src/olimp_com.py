@@ -1,25 +1,23 @@
 import asyncio
 import logging
-
-from bs4 import BeautifulSoup
-
+import time
+from concurrent.futures import Executor
+from dataclasses import replace
+from typing import Callable
+
+from src.cache import LRUCache, ParseCache, body_hash
+from src.http_client import HttpClient
+from src.markets import outcome_key
+from src.metrics import METRICS
+from src.records import Game
+from src.scheduler import PRIORITY_DEFAULT, PRIORITY_LIST
+from src.sports import DATA_SPORT, game_key
 from src.states import OlimpCodes
 from src.utils import fetch_response
 
 my_log = logging.getLogger(__name__)
 
 COEFF_NAME = 'П1'
-# в коде страницы на сайте
-DATA_SPORT = {
-    "Футбол": "1",
-    "Хоккей": "2",
-    "Теннис": "3",
-    "Баскетбол": "5",
-    "Настольный теннис": "40",
-    "Киберспорт": "112",
-    "Волейбол": "10",
-    # и т.д.
-}
 
 
 def log(s, is_error: bool = False):
@@ -36,7 +34,22 @@ class OlimpCom:
                  timeout: int,
                  sport_list: list[str],
                  coeff_name: str,
-                 proxy: str | None = None):
+                 proxy: str | None = None,
+                 client: HttpClient | None = None,
+                 executor: Executor | None = None,
+                 parser_engine: str = 'bs4',
+                 parse_cache_size: int = 1024,
+                 queue_deadline: float | None = None,
+                 coeff_names: dict[str, str] | None = None):
+        """
+        :param coeff_name: исход для сравнения по умолчанию
+        :param coeff_names: вид спорта -> исход, если для него он другой
+        :param executor: пул процессов для разбора страниц матчей. Если не задан - разбор в текущем процессе
+        :param parser_engine: bs4 - разбор через BeautifulSoup, lxml - быстрый разбор через XPath (src.parsers)
+        :param parse_cache_size: для скольких адресов хранить последний результат разбора (0 - не хранить)
+        :param queue_deadline: сколько секунд страницы матчей могут ждать очереди к сайту, после - запрос отменяется
+            (None - без ограничения)
+        """
         self.url = url
         self.headers = {
             'accept': '*/*',
@@ -59,8 +72,33 @@ class OlimpCom:
         self.sport_list = sport_list
         self.coeff_name = coeff_name
         self.proxy = proxy
+        self.client = client
+        self.executor = executor
+        self.parser_engine = parser_engine
+        if parser_engine == 'lxml':
+            # разбор через lxml (src.parsers) загружается только для этого способа разбора
+            from src.parsers import extract_coeffs_lxml
+
+            self.extract_coeffs = extract_coeffs_lxml
+        else:
+            self.extract_coeffs = self._extract_coeffs
+        # последний результат разбора по каждому адресу: если страница не изменилась, повторно не разбираем
+        self.parse_cache = ParseCache(parse_cache_size)
+        self.queue_deadline = queue_deadline
+        self.coeff_names = coeff_names or dict()
+        # адрес страницы матча -> время последнего получения: в очереди к сайту давно не обновлявшиеся страницы идут первыми
+        self.fetched_at = LRUCache(parse_cache_size)
 
     def _get_games(self, response) -> dict:
+        if self.parser_engine == 'lxml':
+            from src.parsers import get_games_lxml
+
+            return get_games_lxml(response, self.url,
+                                  {data_sport: DATA_SPORT.get(data_sport, '') for data_sport in self.sport_list})
+
+        # bs4 загружается только для этого способа разбора
+        from bs4 import BeautifulSoup
+
         soup = BeautifulSoup(response, 'lxml')
 
         all_games = dict()
@@ -74,60 +112,116 @@ class OlimpCom:
                     comp_url = f'{self.url}/{td.find("a").get("href")}'
                     comp_url = comp_url.replace('/betting', '')
                     comp_id = td.find("a").get("id").split("_")[-1]
-                    data_sport = data_sport
-                    all_games[comp_name] = {
-                        "comp_name": comp_name,
-                        "comp_url": comp_url,
-                        "comp_id": comp_id,
-                        "data_sport": data_sport,
-                        "site": "olimp.com",
-                    }
+                    all_games[game_key(all_games, comp_name, data_sport)] = Game(
+                        comp_name=comp_name,
+                        comp_id=comp_id,
+                        sport=data_sport,
+                        site="olimp.com",
+                        comp_url=comp_url,
+                    )
                 except Exception as e:
+                    METRICS.inc("olimp_parse_failures_total", stage="olimpcom_list_row")
                     log(f'Ошибка парсинга для блока\n{tr}:\n{e}')
 
         return all_games
 
     @staticmethod
-    def _extract_coeff(response: str, coeff_name: str) -> float | None:
-        soup = BeautifulSoup(response, 'lxml')
-        try:
-            coeff = float(soup.find("span",
-                                    {"class", "googleStatIssueName"},
-                                    string=coeff_name).parent.find_all("span")[1].get("data-v1"))
-        except:
-            coeff = None
-        return coeff
-
-    async def _get_all_coefficients(self, all_games: dict, coeff_name: str) -> dict | OlimpCodes:
-        # TODO: здесь, скорее всего, нужно будет использовать пул прокси, чтобы каждый запрос был с разного IP
-        # другой вариант - последовательно делать запросы. теряем в скорости,
-        # но меньше потребление памяти и меньше нагрузка на сервер донор
+    def _extract_coeffs(response: str) -> dict[str, float]:
+        """
+        Все исходы на странице матча: название исхода -> коэффициент.
+        """
+        from bs4 import BeautifulSoup
 
+        soup = BeautifulSoup(response, 'lxml')
+        coeffs = dict()
+        for span in soup.find_all("span", {"class", "googleStatIssueName"}):
+            try:
+                name = outcome_key(span.string)
+                if name not in coeffs:
+                    coeffs[name] = float(span.parent.find_all("span")[1].get("data-v1"))
+            except:
+                continue
+        return coeffs
+
+    async def _get_all_coefficients(self,
+                                    all_games: dict,
+                                    coeff_name: str,
+                                    on_game: Callable[[str, Game], None] | None = None) -> dict | OlimpCodes:
         log('Получение списка коэффициентов...')
-        tasks = [fetch_response(game.get("comp_url"), headers=self.headers) for game_name, game in all_games.items()]
+        # все страницы ставятся в очередь сразу, а планировщик общего клиента пропускает к сайту
+        # не больше заданного количества запросов одновременно и с заданной частотой.
+        # С пулом прокси каждая страница идет через самый здоровый свободный прокси, очередь у каждого IP своя.
+        # Разбор каждой страницы начинается сразу после получения ответа, не дожидаясь остальных
+        deadline = None if self.queue_deadline is None else time.monotonic() + self.queue_deadline
+        tasks = [self._fill_coeffs(game_name, game, coeff_name, deadline, on_game)
+                 for game_name, game in all_games.items()]
         results = await asyncio.gather(*tasks)
         if not results:
             return OlimpCodes.error_get_coeffs
-        games = dict()
-
-        # здесь все упирается в счетные задачи. можно попробовать распараллелить именно через процессы
-        for current_game, response in zip(all_games.items(), results):
-            coeff = self._extract_coeff(response, coeff_name)
-            games[current_game[0]] = current_game[1] | {"coeff": coeff, "coeff_name": coeff_name}
-        return games
+        return dict(zip(all_games, results))
+
+    async def _fill_coeffs(self,
+                           game_name: str,
+                           game: Game,
+                           coeff_name: str,
+                           deadline: float | None,
+                           on_game: Callable[[str, Game], None] | None) -> Game:
+        """
+        Новая запись игры с коэффициентами текущего цикла: запись из кэша разбора общая для всех циклов,
+        ее могут читать сравнение и запись истории предыдущего цикла.
+        """
+        coeffs = await self._fetch_coeffs(game, deadline)
+        game_coeff_name = self.coeff_names.get(game.sport, coeff_name)
+        game = replace(game, coeff_name=game_coeff_name, coeff=coeffs.get(outcome_key(game_coeff_name)), coeffs=coeffs)
+        if on_game is not None:
+            on_game(game_name, game)
+        return game
+
+    async def _fetch_coeffs(self, game: Game, deadline: float | None = None) -> dict[str, float]:
+        url = game.comp_url
+        response = await fetch_response(url, headers=self.headers, timeout=self.timeout, client=self.client,
+                                        priority=PRIORITY_DEFAULT + self.fetched_at.get(url, 0.0), deadline=deadline)
+        if not response:
+            return dict()
+        self.fetched_at.put(url, time.monotonic())
+        digest = body_hash(response)
+        coeffs = self.parse_cache.get(url, digest, stage='olimpcom_coeffs')
+        if coeffs is not None:
+            return coeffs
+        coeffs = dict()
+        try:
+            with METRICS.timer("olimp_parse_seconds", stage="olimpcom_coeffs"):
+                if self.executor is None:
+                    coeffs = self.extract_coeffs(response)
+                else:
+                    # разбор страницы - счетная задача, в пуле процессов она не блокирует event loop
+                    loop = asyncio.get_running_loop()
+                    coeffs = await loop.run_in_executor(self.executor, self.extract_coeffs, response)
+        except Exception as e:
+            log(f'Ошибка разбора страницы {url}: {e}', is_error=True)
+        if not coeffs:
+            METRICS.inc("olimp_parse_failures_total", stage="olimpcom_coeffs")
+        self.parse_cache.put(url, digest, coeffs)
+        return coeffs
 
     async def get_bets(self, is_need_coeffs: bool = False):
         log('Получение информации для OlimpCom...')
         response = await fetch_response(url=f'{self.url}', headers=self.headers, proxy=self.proxy,
-                                        timeout=self.timeout)
+                                        timeout=self.timeout, client=self.client, priority=PRIORITY_LIST)
         if not response:
             # не знаю как у вас принято обрабатывать такого рода ошибки:
             # вызывать кастомное исключение и ловить его выше, или что-то такого плана
             log('Возможно требуется заменить ссылку через бота https://t.me/olimpbet_bot и дальше в разделе "Лайв"')
             return {"result": False, "response": OlimpCodes.error_response}
 
-        all_games = self._get_games(response)
+        digest = body_hash(response)
+        all_games = self.parse_cache.get(self.url, digest, stage='olimpcom_list')
+        if all_games is None:
+            with METRICS.timer("olimp_parse_seconds", stage="olimpcom_list"):
+                all_games = self._get_games(response)
+            self.parse_cache.put(self.url, digest, all_games)
         if not all_games:
+            METRICS.inc("olimp_parse_failures_total", stage="olimpcom_list")
             log('Возможно сменилась верстка на сайте...')
             return {"result": False, "response": OlimpCodes.error_games_pars}
 
@@ -136,8 +230,22 @@ class OlimpCom:
         if not is_need_coeffs:
             return {"result": True, "response": all_games}
 
-        games = await self._get_all_coefficients(all_games, coeff_name=self.coeff_name)
-        if not games:
+        return await self.get_coefficients(all_games)
+
+    async def get_coefficients(self, all_games: dict, on_game: Callable[[str, Game], None] | None = None) -> dict:
+        """
+        Получение коэффициентов только для переданных игр.
+        Вызывается уже после сравнения списков игр с olimp.bet, чтобы не запрашивать страницы матчей,
+        которых нет на другом сайте.
+        :param all_games: игры (результат get_bets без коэффициентов), для которых нужны коэффициенты
+        :param on_game: вызывается для каждой игры (ключ, игра с коэффициентами), как только разобрана ее страница,
+            не дожидаясь остальных
+        """
+        if not all_games:
+            return {"result": True, "response": dict()}
+
+        games = await self._get_all_coefficients(all_games, coeff_name=self.coeff_name, on_game=on_game)
+        if not games or isinstance(games, OlimpCodes):
             log('Возможно сменилась верстка на сайте...')
             return {"result": False, "response": OlimpCodes.error_get_coeffs}
 
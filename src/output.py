@@ -0,0 +1,400 @@
+"""
+Вывод результатов сравнения: каждое совпадение - отдельная запись (словарь), которая ставится в очередь
+и сразу возвращает управление. Отдельная задача забирает накопившиеся записи пачкой и отдает их всем
+приемникам одновременно:
+- log - в лог, по сообщению на совпадение (как раньше, но без одной огромной строки на все игры);
+- jsonl - JSON-строка на запись в файл compare.jsonl;
+- csv - строка на исход в файл compare.csv;
+- stream - локальный сервер: WebSocket (ws://127.0.0.1:<порт>/ws) и Server-Sent Events (http://127.0.0.1:<порт>/events),
+  клиенты получают записи, пока идет сравнение.
+Запись в файлы идет в отдельном потоке, поэтому большой набор результатов не блокирует event loop.
+"""
+import asyncio
+import csv
+import io
+import json
+import logging
+import math
+import time
+from pathlib import Path
+
+from aiohttp import web
+
+from src.metrics import METRICS
+
+my_log = logging.getLogger(__name__)
+
+SINKS = ('log', 'jsonl', 'csv', 'stream')
+CSV_FIELDS = ('ts', 'type', 'game', 'site', 'comp_id', 'site_compare', 'comp_id_compare', 'confidence',
+              'outcome', 'coeff', 'sign', 'coeff_compare', 'job')
+# сколько записей может ждать отправки одному клиенту сервера, после - клиент отключается
+CLIENT_QUEUE_SIZE = 1000
+
+
+def log(s, is_error: bool = False):
+    msg = f'[OUTPUT] -> {s}'
+    if not is_error:
+        my_log.info(msg)
+    else:
+        my_log.error(msg)
+
+
+def _pair_msg(record: dict) -> str:
+    confidence = record.get("confidence")
+    # уверенность выводится только для неточных совпадений названий
+    confidence_msg = '' if confidence is None or confidence >= 1 else f' (совпадение {confidence})'
+    return (f'{record.get("site")} [{record.get("comp_id")} {record.get("comp_name")}] - '
+            f'{record.get("site_compare")} [{record.get("comp_id_compare")} {record.get("comp_name_compare")}]'
+            f'{confidence_msg}')
+
+
+def _summary_msg(record: dict) -> str:
+    kind = record.get("kind")
+    count = record.get("count")
+    if kind == 'pairs':
+        return f'Количество совпадений =  {count}' if count else 'Не найдены совпадающие игры!'
+    if kind == 'coeffs':
+        if not count:
+            return 'Не найдены совпадающие игры с заданным знаком!'
+        return (f'Совпадающие игры для набора знаков "{" ".join(record.get("signs"))}": '
+                f'количество совпадений =  {count}, из них с вилкой = {record.get("arbitrage")}')
+    if not count:
+        return f'Изменений нет, совпадений = {record.get("unchanged")}'
+    return (f'Новых = {record.get("added")}, пропало = {record.get("removed")}, '
+            f'изменилось = {record.get("changed")} (смена знака = {record.get("sign_flips")}), '
+            f'без изменений = {record.get("unchanged")}')
+
+
+def format_record(record: dict) -> str:
+    """
+    Текст записи для лога, записи заданий (src.jobs) - с названием задания.
+    """
+    text = _format_record(record)
+    return f'[{record.get("job")}] {text}' if record.get("job") else text
+
+
+def _format_record(record: dict) -> str:
+    record_type = record.get("type")
+    if record_type == 'summary':
+        return _summary_msg(record)
+    if record_type == 'removed':
+        return f'- {record.get("game")}'
+    if record_type == 'pair':
+        return f'Совпадение: {_pair_msg(record)}'
+
+    prefix = {'added': '+ ', 'changed': '* '}.get(record_type, '')
+    lines = [f'{prefix}{_pair_msg(record)}']
+    for outcome in record.get("outcomes") or []:
+        if record_type == 'changed':
+            flip_msg = f', знак {outcome.get("sign_old")} -> {outcome.get("sign")}' if outcome.get("is_sign_flip") else ''
+            lines.append(f'{outcome.get("outcome")} - {outcome.get("coeff_old")} -> {outcome.get("coeff")} / '
+                         f'{outcome.get("coeff_compare_old")} -> {outcome.get("coeff_compare")}{flip_msg}')
+        elif record_type == 'added':
+            lines.append(f'{outcome.get("outcome")} - {outcome.get("coeff")} {outcome.get("sign")} '
+                         f'{outcome.get("coeff_compare")}')
+        else:
+            lines.append(f'{outcome.get("outcome")} - {record.get("site")} {outcome.get("coeff")} {outcome.get("sign")} '
+                         f'{outcome.get("coeff_compare")} {record.get("site_compare")}')
+    for book in record.get("books") or []:
+        lines.append(f'{book.get("book")}: маржа {record.get("site")} {book.get("margin")}% / '
+                     f'{record.get("site_compare")} {book.get("margin_compare")}%, вилка {book.get("arbitrage")}%')
+    return "\n".join(lines)
+
+
+def log_record(record: dict):
+    """
+    Синхронный вывод записи в лог - когда очередь вывода не запущена (например, в замерах).
+    """
+    my_log.info(format_record(record))
+
+
+def _to_json(record: dict) -> str:
+    """
+    NaN и бесконечность не входят в JSON - в записи они выводятся как null.
+    """
+    try:
+        return json.dumps(record, ensure_ascii=False, separators=(',', ':'), allow_nan=False)
+    except ValueError:
+        return json.dumps(_without_nan(record), ensure_ascii=False, separators=(',', ':'), allow_nan=False)
+
+
+def _without_nan(value):
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _without_nan(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_without_nan(item) for item in value]
+    return value
+
+
+class Sink:
+    """
+    Приемник записей. write вызывается задачей вывода с пачкой записей в порядке их поступления.
+    """
+    name = ''
+
+    async def start(self):
+        pass
+
+    async def write(self, records: list[dict]):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class LogSink(Sink):
+    name = 'log'
+
+    async def write(self, records: list[dict]):
+        await asyncio.to_thread(self._write, records)
+
+    @staticmethod
+    def _write(records: list[dict]):
+        for record in records:
+            log_record(record)
+
+
+class _FileSink(Sink):
+    """
+    Дописывает строки в файл, запись на диск - в отдельном потоке.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = None
+
+    async def start(self):
+        self._file = open(self.path, 'a', encoding='utf-8', newline='')
+
+    async def write(self, records: list[dict]):
+        text = self._format(records)
+        if text:
+            await asyncio.to_thread(self._write, text)
+
+    def _write(self, text: str):
+        self._file.write(text)
+        self._file.flush()
+
+    def _format(self, records: list[dict]) -> str:
+        raise NotImplementedError
+
+    async def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class JsonlSink(_FileSink):
+    name = 'jsonl'
+
+    def _format(self, records: list[dict]) -> str:
+        return ''.join(f'{_to_json(record)}\n' for record in records)
+
+
+class CsvSink(_FileSink):
+    """
+    Строка на каждый исход совпадения (для пар без коэффициентов и пропавших игр - одна строка без исхода),
+    итоги не пишутся.
+    """
+    name = 'csv'
+
+    async def start(self):
+        is_new = not self.path.exists() or not self.path.stat().st_size
+        await super().start()
+        if is_new:
+            self._write(self._format_rows([dict(zip(CSV_FIELDS, CSV_FIELDS))]))
+
+    def _format(self, records: list[dict]) -> str:
+        rows = []
+        for record in records:
+            if record.get("type") == 'summary':
+                continue
+            row = {field: record.get(field) for field in CSV_FIELDS}
+            outcomes = record.get("outcomes")
+            if not outcomes:
+                rows.append(row)
+                continue
+            for outcome in outcomes:
+                rows.append(row | {field: outcome.get(field) for field in ('outcome', 'coeff', 'sign', 'coeff_compare')})
+        return self._format_rows(rows)
+
+    @staticmethod
+    def _format_rows(rows: list[dict]) -> str:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, lineterminator='\n')
+        writer.writerows(rows)
+        return buffer.getvalue()
+
+
+class StreamSink(Sink):
+    """
+    Локальный сервер для ботов: каждая запись уходит всем подключенным клиентам JSON-сообщением
+    (WebSocket /ws) или событием (SSE /events). У каждого клиента своя очередь, медленный клиент
+    отключается и не задерживает остальных.
+    """
+    name = 'stream'
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8790):
+        self.host = host
+        self.port = port
+        self._clients: set[asyncio.Queue] = set()
+        self._runner: web.AppRunner | None = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/ws', self._handle_ws)
+        app.router.add_get('/events', self._handle_sse)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        log(f'Результаты сравнения: ws://{self.host}:{self.port}/ws, http://{self.host}:{self.port}/events')
+
+    async def write(self, records: list[dict]):
+        messages = [_to_json(record) for record in records]
+        for client in list(self._clients):
+            try:
+                for message in messages:
+                    client.put_nowait(message)
+            except asyncio.QueueFull:
+                METRICS.inc("olimp_output_dropped_total", sink=self.name)
+                self._disconnect(client)
+
+    def _connect(self) -> asyncio.Queue:
+        client = asyncio.Queue(CLIENT_QUEUE_SIZE)
+        self._clients.add(client)
+        METRICS.set("olimp_output_clients", len(self._clients))
+        return client
+
+    def _disconnect(self, client: asyncio.Queue):
+        if client not in self._clients:
+            return
+        self._clients.discard(client)
+        METRICS.set("olimp_output_clients", len(self._clients))
+        # обработчик клиента завершается по None; если очередь заполнена - освобождаем место
+        while client.full():
+            client.get_nowait()
+        client.put_nowait(None)
+
+    async def _handle_ws(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        client = self._connect()
+        try:
+            while (message := await client.get()) is not None:
+                await ws.send_str(message)
+        finally:
+            self._disconnect(client)
+            await ws.close()
+        return ws
+
+    async def _handle_sse(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+        client = self._connect()
+        try:
+            while (message := await client.get()) is not None:
+                await response.write(f'data: {message}\n\n'.encode('utf-8'))
+        finally:
+            self._disconnect(client)
+        return response
+
+    async def close(self):
+        for client in list(self._clients):
+            self._disconnect(client)
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class Output:
+    """
+    Очередь записей и задача, которая раздает их приемникам. emit можно вызывать из синхронного кода
+    в потоке event loop: запись только ставится в очередь.
+    """
+
+    def __init__(self, sinks: list[Sink], maxsize: int = 100000):
+        """
+        :param maxsize: сколько записей может ждать вывода, новые записи сверх этого отбрасываются
+        """
+        self.sinks = sinks
+        self.maxsize = maxsize
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+
+    async def start(self):
+        for sink in self.sinks:
+            await sink.start()
+        self._queue = asyncio.Queue(self.maxsize)
+        self._worker = asyncio.create_task(self._run())
+
+    def emit(self, record: dict):
+        if self._queue is None:
+            log_record(record)
+            return
+        try:
+            self._queue.put_nowait((time.monotonic(), record))
+        except asyncio.QueueFull:
+            METRICS.inc("olimp_output_dropped_total", sink='queue')
+
+    async def close(self):
+        """
+        Выводит все записи из очереди и закрывает приемники.
+        """
+        if self._queue is not None:
+            await self._queue.put(None)
+            await self._worker
+            self._queue = None
+        for sink in self.sinks:
+            await sink.close()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _run(self):
+        is_closed = False
+        while not is_closed:
+            items = [await self._queue.get()]
+            while not self._queue.empty():
+                items.append(self._queue.get_nowait())
+            is_closed = items[-1] is None
+            items = [item for item in items if item is not None]
+            if not items:
+                continue
+            # задержка самой старой записи пачки от постановки в очередь до вывода
+            METRICS.observe("olimp_output_delay_seconds", time.monotonic() - items[0][0])
+            records = [record for _, record in items]
+            await asyncio.gather(*[self._write(sink, records) for sink in self.sinks])
+
+    @staticmethod
+    async def _write(sink: Sink, records: list[dict]):
+        try:
+            await sink.write(records)
+            METRICS.inc("olimp_output_records_total", len(records), sink=sink.name)
+        except Exception as e:
+            log(f'Ошибка вывода в {sink.name}: {e}', is_error=True)
+
+
+def make_output(names: list[str], directory: str | Path, port: int = 8790) -> Output:
+    """
+    :param names: приемники из SINKS
+    :param directory: папка для compare.jsonl и compare.csv
+    :param port: порт локального сервера для stream
+    """
+    sinks = []
+    for name in names:
+        if name == 'log':
+            sinks.append(LogSink())
+        elif name == 'jsonl':
+            sinks.append(JsonlSink(Path(directory) / 'compare.jsonl'))
+        elif name == 'csv':
+            sinks.append(CsvSink(Path(directory) / 'compare.csv'))
+        elif name == 'stream':
+            sinks.append(StreamSink(port=port))
+    return Output(sinks)
@@ -0,0 +1,97 @@
+"""
+Сохраняемые между запусками пары совпадающих игр по идентификаторам сайтов.
+Пока матч идет в лайве, его comp_id на каждом сайте не меняется (olimp.com - суффикс id ссылки,
+olimp.bet - id события), поэтому сопоставление по названиям нужно только для новых игр,
+а известные пары находятся по идентификатору.
+Пара удаляется, если хотя бы одной из ее игр не было в списках дольше ttl секунд.
+"""
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from src.metrics import METRICS
+
+my_log = logging.getLogger(__name__)
+
+
+def log(s, is_error: bool = False):
+    msg = f'[PAIRS] -> {s}'
+    if not is_error:
+        my_log.info(msg)
+    else:
+        my_log.error(msg)
+
+
+class PairCache:
+    """
+    comp_id игры первого сайта (olimp.com) -> [comp_id игры второго сайта (olimp.bet), уверенность, когда пара
+    последний раз была в списках обоих сайтов]. Файл - JSON, перезаписывается целиком через временный файл.
+    """
+
+    def __init__(self, path: str | Path | None = None, ttl: float = 600):
+        """
+        :param path: файл для сохранения между запусками (None - только в памяти)
+        :param ttl: через сколько секунд после пропадения игры из списков удалять пару
+        """
+        self.path = Path(path) if path else None
+        self.ttl = ttl
+        self._pairs: dict[str, list] = dict()
+        # есть изменения, которые нужно сохранить: новые или удаленные пары
+        self._is_changed = False
+        if self.path is not None and self.path.exists():
+            try:
+                self._pairs = json.loads(self.path.read_text(encoding='utf-8'))
+            except (OSError, ValueError) as e:
+                log(f'Не удалось прочитать {self.path}: {e}', is_error=True)
+            self.expire()
+            log(f'Загружено пар: {len(self._pairs)}')
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def get(self, comp_id: str) -> tuple[str, float] | None:
+        """
+        :return: comp_id парной игры и уверенность сопоставления или None
+        """
+        pair = self._pairs.get(comp_id)
+        return None if pair is None else (pair[0], pair[1])
+
+    def touch(self, comp_id: str):
+        """
+        Пара есть в текущих списках обоих сайтов.
+        """
+        self._pairs[comp_id][2] = time.time()
+
+    def put(self, comp_id: str, comp_id_compare: str, confidence: float):
+        self._pairs[comp_id] = [comp_id_compare, confidence, time.time()]
+        self._is_changed = True
+
+    def expire(self):
+        deadline = time.time() - self.ttl
+        expired = [comp_id for comp_id, pair in self._pairs.items() if pair[2] < deadline]
+        for comp_id in expired:
+            del self._pairs[comp_id]
+        if expired:
+            self._is_changed = True
+        METRICS.set("olimp_pair_cache_size", len(self._pairs))
+
+    def save(self, force: bool = False):
+        """
+        Сохранение в файл, если есть новые или удаленные пары.
+        :param force: сохранить в любом случае (время последнего появления пар в списках)
+        """
+        if self.path is None or not (self._is_changed or force):
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(f'{self.path.name}.tmp')
+            tmp_path.write_text(json.dumps(self._pairs, ensure_ascii=False), encoding='utf-8')
+            os.replace(tmp_path, self.path)
+            self._is_changed = False
+        except OSError as e:
+            log(f'Не удалось сохранить {self.path}: {e}', is_error=True)
+
+    def close(self):
+        self.save(force=True)
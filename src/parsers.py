@@ -0,0 +1,249 @@
+"""
+Быстрые способы разбора ответов сайтов.
+- olimp.com: скомпилированные XPath-выражения поверх lxml, без построения дерева объектов BeautifulSoup.
+  Результат совпадает с разбором через BeautifulSoup
+  (проверка на сохраненных страницах: python -m src.parsers olimpcom <страница_списка> [<страница_матча>]).
+- olimp.bet: потоковый разбор JSON через ijson, в память попадают только нужные поля событий нужных видов спорта
+  (сравнение времени и пиковой памяти с json.loads: python -m src.parsers olimpbet [<файл_ответа>] [<вид_спорта>]).
+"""
+import json
+import logging
+import sys
+import time
+import tracemalloc
+
+from lxml import etree
+
+from src.markets import outcome_key
+from src.metrics import METRICS
+from src.records import Game, make_outcome
+from src.sports import game_key
+
+my_log = logging.getLogger(__name__)
+
+HTML_PARSER = etree.HTMLParser(encoding='utf-8')
+
+# строки таблицы списка игр для заданного вида спорта
+XPATH_GAMES = etree.XPath('//tr[@data-sport=$code]')
+XPATH_GAME_TD = etree.XPath('.//td')
+XPATH_GAME_LINK = etree.XPath('.//a')
+# все исходы на странице матча и коэффициент для каждого из них (второй span в родителе названия исхода)
+XPATH_OUTCOMES = etree.XPath(
+    '//span[contains(concat(" ", normalize-space(@class), " "), " googleStatIssueName ")][not(*)]')
+XPATH_OUTCOME_COEFF = etree.XPath('../descendant::span[2]/@data-v1')
+
+
+def log(s, is_error: bool = False):
+    msg = f'[PARSERS] -> {s}'
+    if not is_error:
+        my_log.info(msg)
+    else:
+        my_log.error(msg)
+
+
+def _to_tree(response: str) -> etree._Element | None:
+    # разбор из байтов, т.к. lxml не принимает строки с объявлением кодировки
+    try:
+        return etree.fromstring(response.encode('utf-8'), parser=HTML_PARSER)
+    except etree.LxmlError:
+        return None
+
+
+def get_games_lxml(response: str, url: str, sport_codes: dict[str, str]) -> dict:
+    """
+    Аналог OlimpCom._get_games.
+    :param url: ссылка на olimp.com, от нее строятся ссылки на страницы матчей
+    :param sport_codes: вид спорта -> data-sport в коде страницы
+    """
+    tree = _to_tree(response)
+    all_games = dict()
+    if tree is None:
+        return all_games
+
+    for data_sport, data_sport_code in sport_codes.items():
+        for tr in XPATH_GAMES(tree, code=data_sport_code):
+            try:
+                link = XPATH_GAME_LINK(XPATH_GAME_TD(tr)[-1])[0]
+                comp_name = ''.join(link.itertext())
+                comp_url = f'{url}/{link.get("href")}'
+                comp_url = comp_url.replace('/betting', '')
+                comp_id = link.get("id").split("_")[-1]
+                all_games[game_key(all_games, comp_name, data_sport)] = Game(
+                    comp_name=comp_name,
+                    comp_id=comp_id,
+                    sport=data_sport,
+                    site="olimp.com",
+                    comp_url=comp_url,
+                )
+            except Exception as e:
+                METRICS.inc("olimp_parse_failures_total", stage="olimpcom_list_row")
+                log(f'Ошибка парсинга для блока\n{etree.tostring(tr, encoding="unicode")}:\n{e}')
+
+    return all_games
+
+
+# префикс событий в ответе olimp.bet: [{"payload": {"sport": ..., "competitionsWithEvents": [{"events": [...]}]}}]
+PREFIX_SPORT_NAME = 'item.payload.sport.name'
+PREFIX_EVENT = 'item.payload.competitionsWithEvents.item.events.item'
+PREFIX_OUTCOME = f'{PREFIX_EVENT}.outcomes.item'
+# поля события и исхода, которые используются дальше
+EVENT_FIELDS = {f'{PREFIX_EVENT}.{field}': field
+                for field in ("id", "name", "sportName", "competitionName", "startDateTime")}
+OUTCOME_FIELDS = {f'{PREFIX_OUTCOME}.{field}': field
+                  for field in ("groupName", "shortName", "probability", "param")}
+
+
+def get_games_stream(response: str | bytes, sport_list: list[str], groups: frozenset[str] | None = None) -> dict:
+    """
+    Аналог OlimpBet._get_games без загрузки всего ответа в память.
+    События видов спорта не из sport_list пропускаются без создания объектов,
+    у событий и исходов сохраняются только используемые поля.
+    :param groups: сохраняемые группы исходов (src.records.outcome_groups), None - все
+    """
+    # ijson загружается только для потокового разбора (JSON_ENGINE = stream)
+    import ijson
+
+    if isinstance(response, str):
+        response = response.strip().encode('utf-8')
+
+    all_games = dict()
+    # вид спорта текущего блока: None - еще не встречался, тогда решение по sportName самого события
+    sport_name = None
+    event = None
+    outcome = None
+    for prefix, event_type, value in ijson.parse(response):
+        if prefix == 'item' and event_type == 'start_map':
+            sport_name = None
+        elif prefix == PREFIX_SPORT_NAME:
+            sport_name = (value or '').strip()
+        elif not prefix.startswith(PREFIX_EVENT):
+            continue
+        elif sport_name is not None and sport_name not in sport_list:
+            continue
+        elif prefix == PREFIX_EVENT:
+            if event_type == 'start_map':
+                event = {"outcomes": []}
+            elif event_type == 'end_map':
+                _add_event(all_games, event, sport_name, sport_list)
+                event = None
+        elif prefix == PREFIX_OUTCOME:
+            if event_type == 'start_map':
+                outcome = dict()
+            elif event_type == 'end_map':
+                outcome = make_outcome(outcome, groups)
+                if outcome is not None:
+                    event["outcomes"].append(outcome)
+                outcome = None
+        elif prefix in OUTCOME_FIELDS:
+            outcome[OUTCOME_FIELDS[prefix]] = value
+        elif prefix in EVENT_FIELDS:
+            event[EVENT_FIELDS[prefix]] = value
+
+    return all_games
+
+
+def _add_event(all_games: dict, event: dict, sport_name: str | None, sport_list: list[str]):
+    try:
+        comp_name = event.get("name").strip()
+        comp_id = event.get("id").strip()
+        data_sport_name = event.get("sportName").strip()
+        if sport_name is None and data_sport_name not in sport_list:
+            return
+        all_games[comp_name] = Game(
+            comp_name=comp_name,
+            comp_id=comp_id,
+            sport=data_sport_name,
+            site="olimp.bet",
+            competition=(event.get("competitionName") or '').strip(),
+            start_ts=event.get("startDateTime"),
+            outcomes=event.get("outcomes"),
+        )
+    except Exception as e:
+        METRICS.inc("olimp_parse_failures_total", stage="olimpbet_list_row")
+        log(f'Ошибка парсинга:\n{e}')
+
+
+def _measure(func, *args, repeat: int = 10) -> tuple:
+    # время - без tracemalloc (он сильно замедляет разбор), пиковая память - отдельным запуском
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    elapsed = (time.perf_counter() - start_time) / repeat
+
+    tracemalloc.start()
+    result = func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def compare_olimpbet(path: str = 'Data/raw_response.txt', sport_name: str = 'Футбол'):
+    """
+    Сравнение времени разбора и пиковой памяти json.loads и потокового разбора на сохраненном ответе olimp.bet.
+    """
+    from src.olimp_bet import OlimpBet
+
+    olimp_bet = OlimpBet(url='', user_agent='', timeout=30, xguid_olimpbet='', user_ukey='',
+                         sport_list=[sport_name], coeff_name='')
+    # json.loads работает со строкой, потоковому разбору достаточно байтов ответа без декодирования
+    with open(path, 'rb') as file:
+        response_bytes = file.read()
+    response = response_bytes.decode('utf-8')
+
+    games_json, time_json, peak_json = _measure(olimp_bet._get_games, response)
+    games_stream, time_stream, peak_stream = _measure(get_games_stream, response_bytes, [sport_name])
+    same = games_json == games_stream
+
+    print(f'json.loads: игр = {len(games_json)}, время = {round(time_json * 1000, 2)} мс, '
+          f'пик памяти = {round(peak_json / 1024, 1)} КБ')
+    print(f'ijson: игр = {len(games_stream)}, время = {round(time_stream * 1000, 2)} мс, '
+          f'пик памяти = {round(peak_stream / 1024, 1)} КБ')
+    print(f'Результаты совпадают: {same}')
+
+
+def extract_coeffs_lxml(response: str) -> dict[str, float]:
+    """
+    Аналог OlimpCom._extract_coeffs.
+    """
+    coeffs = dict()
+    tree = _to_tree(response)
+    if tree is None:
+        return coeffs
+    for span in XPATH_OUTCOMES(tree):
+        try:
+            name = outcome_key(span.text)
+            if name not in coeffs:
+                coeffs[name] = float(XPATH_OUTCOME_COEFF(span)[0])
+        except:
+            continue
+    return coeffs
+
+
+def check_parity(list_path: str, match_path: str | None = None):
+    """
+    Сравнение результатов разбора BeautifulSoup и lxml на сохраненных страницах.
+    """
+    from src.olimp_com import OlimpCom
+    from src.sports import DATA_SPORT
+
+    olimp_com = OlimpCom(url='https://olimp.com/betting', user_agent='', timeout=30,
+                         sport_list=list(DATA_SPORT), coeff_name='П1')
+    with open(list_path, encoding='utf-8') as file:
+        response = file.read()
+    games_bs4 = olimp_com._get_games(response)
+    games_lxml = get_games_lxml(response, olimp_com.url, DATA_SPORT)
+    print(f'Список игр: bs4 = {len(games_bs4)}, lxml = {len(games_lxml)}, совпадают: {games_bs4 == games_lxml}')
+
+    if match_path:
+        with open(match_path, encoding='utf-8') as file:
+            response = file.read()
+        coeffs_bs4 = OlimpCom._extract_coeffs(response)
+        coeffs_lxml = extract_coeffs_lxml(response)
+        print(f'Все исходы: bs4 = {len(coeffs_bs4)}, lxml = {len(coeffs_lxml)}, совпадают: {coeffs_bs4 == coeffs_lxml}')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['olimpbet']:
+        compare_olimpbet(*sys.argv[2:4])
+    else:
+        check_parity(*sys.argv[2:4])
@@ -0,0 +1,150 @@
+"""
+Пул прокси: для каждого прокси считается скользящее среднее времени ответа, доля ошибок и бан
+(ответ 403/407/429 или несколько ошибок подряд). Для каждого запроса выбирается самый здоровый
+и наименее загруженный прокси, поэтому запросы страниц матчей расходятся по разным IP.
+Для сайтов, где сессия привязана к IP (cookies olimp.bet), прокси закрепляется за хостом, пока он не забанен.
+
+Соединения переиспользуются общим пулом HttpClient: ключ соединения aiohttp включает прокси,
+поэтому у каждого прокси свои keep-alive соединения.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from src.metrics import METRICS
+
+my_log = logging.getLogger(__name__)
+
+# ответы, после которых прокси считается заблокированным сайтом
+BAN_STATUSES = (403, 407, 429)
+# вес последнего замера в скользящем среднем времени ответа
+LATENCY_ALPHA = 0.3
+# нижняя граница времени ответа в оценке: без нее прокси без замеров забирал бы все запросы сразу
+MIN_LATENCY = 0.01
+
+
+def log(s, is_error: bool = False):
+    msg = f'[PROXY] -> {s}'
+    if not is_error:
+        my_log.info(msg)
+    else:
+        my_log.error(msg)
+
+
+@lru_cache(maxsize=None)
+def proxy_url(proxy: str) -> str:
+    """
+    ip:port:login:password -> https://login:password@ip:port, ip:port -> http://ip:port, адрес со схемой - без изменений.
+    """
+    if '://' in proxy:
+        return proxy
+    parts = proxy.split(':')
+    if len(parts) == 4:
+        ip, port, login, password = parts
+        return f"https://{login}:{password}@{ip}:{port}"
+    return f'http://{proxy}'
+
+
+def proxy_name(url: str) -> str:
+    """
+    Адрес прокси без логина и пароля - для логов и меток метрик.
+    """
+    parts = urlsplit(url)
+    return f'{parts.hostname}:{parts.port}'
+
+
+@dataclass(slots=True)
+class ProxyState:
+    url: str
+    name: str
+    latency: float = 0.0
+    requests: int = 0
+    errors: int = 0
+    errors_in_row: int = 0
+    banned_until: float = 0.0
+    in_flight: int = 0
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+    def is_banned(self, now: float) -> bool:
+        return self.banned_until > now
+
+    def score(self) -> float:
+        """
+        Меньше - лучше: время ответа с поправкой на ошибки и текущую загрузку.
+        Новый прокси без замеров выбирается раньше остальных, чтобы по нему появилась статистика.
+        """
+        return max(self.latency, MIN_LATENCY) * (1 + 4 * self.error_rate) * (1 + self.in_flight)
+
+
+class ProxyPool:
+    def __init__(self, proxies: list[str], ban_time: float = 300, max_errors_in_row: int = 3):
+        """
+        :param proxies: прокси в формате ip:port:login:password, ip:port или адрес со схемой
+        :param ban_time: сколько секунд не использовать забаненный прокси
+        :param max_errors_in_row: после скольких ошибок подряд прокси считается забаненным
+        """
+        urls = dict.fromkeys(proxy_url(proxy) for proxy in proxies)
+        self.proxies = [ProxyState(url, proxy_name(url)) for url in urls]
+        self.ban_time = ban_time
+        self.max_errors_in_row = max_errors_in_row
+        # хост -> закрепленный прокси
+        self._sticky: dict[str, ProxyState] = dict()
+
+    @classmethod
+    def from_file(cls, path: str | Path, **kwargs) -> 'ProxyPool':
+        """
+        Один прокси на строку, пустые строки и строки с # пропускаются.
+        """
+        lines = Path(path).read_text(encoding='utf-8').splitlines()
+        return cls([line.strip() for line in lines if line.strip() and not line.lstrip().startswith('#')], **kwargs)
+
+    def __len__(self):
+        return len(self.proxies)
+
+    def acquire(self, host: str, sticky: bool = False) -> ProxyState | None:
+        """
+        :param sticky: закрепить прокси за хостом и использовать его, пока он не забанен
+        :return: выбранный прокси (после запроса обязательно release) или None, если все забанены
+        """
+        now = time.monotonic()
+        proxy = self._sticky.get(host) if sticky else None
+        if proxy is None or proxy.is_banned(now):
+            available = [proxy for proxy in self.proxies if not proxy.is_banned(now)]
+            if not available:
+                log('Все прокси забанены, запрос пойдет без прокси!', is_error=True)
+                return None
+            proxy = min(available, key=ProxyState.score)
+            if sticky:
+                self._sticky[host] = proxy
+        proxy.in_flight += 1
+        return proxy
+
+    def release(self, proxy: ProxyState, latency: float, is_ok: bool, status: int | None = None):
+        """
+        :param latency: время запроса, сек
+        :param is_ok: запрос выполнен без исключения
+        :param status: код ответа, если ответ получен (5xx считается ошибкой прокси)
+        """
+        proxy.in_flight -= 1
+        proxy.requests += 1
+        proxy.latency = latency if proxy.requests == 1 else (
+                LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * proxy.latency)
+        if is_ok and (status is None or status < 500) and status not in BAN_STATUSES:
+            proxy.errors_in_row = 0
+        else:
+            proxy.errors += 1
+            proxy.errors_in_row += 1
+            METRICS.inc("olimp_proxy_errors_total", proxy=proxy.name)
+            if status in BAN_STATUSES or proxy.errors_in_row >= self.max_errors_in_row:
+                proxy.banned_until = time.monotonic() + self.ban_time
+                proxy.errors_in_row = 0
+                METRICS.inc("olimp_proxy_bans_total", proxy=proxy.name)
+                log(f'Прокси {proxy.name} забанен на {self.ban_time} сек (ответ {status})')
+        METRICS.inc("olimp_proxy_requests_total", proxy=proxy.name)
+        METRICS.observe("olimp_proxy_request_seconds", latency, proxy=proxy.name)
@@ -0,0 +1,78 @@
+"""
+Записи игр и исходов, которые строят разборщики обоих сайтов.
+Вместо словаря на каждую игру и каждый исход - объекты со __slots__: меньше памяти и быстрее доступ к полям.
+Результаты разбора хранятся в кэше (src.cache.ParseCache) и после разбора не изменяются:
+уверенность сопоставления и коэффициенты записываются в новые записи текущего цикла (dataclasses.replace).
+"""
+from dataclasses import dataclass, field
+
+from src.markets import outcome_key
+
+
+@dataclass(slots=True)
+class Outcome:
+    """
+    Исход olimp.bet. key - название исхода для сравнения с olimp.com (src.markets.outcome_key).
+    """
+    group_name: str
+    short_name: str
+    key: str
+    coeff: float | None
+
+
+@dataclass(slots=True)
+class Game:
+    comp_name: str
+    comp_id: str
+    sport: str
+    site: str
+    # olimp.com: страница матча с коэффициентами
+    comp_url: str | None = None
+    # olimp.bet: для сопоставления с играми другого сайта
+    competition: str = ''
+    start_ts: int | None = None
+    # olimp.bet: исходы только нужных групп (для дальнейшего получения коэффициентов)
+    outcomes: list[Outcome] = field(default_factory=list)
+    # заполняются после сопоставления игр и получения коэффициентов - в новой записи на каждый цикл
+    # (dataclasses.replace), запись из кэша разбора общая для всех циклов и не изменяется
+    coeff: float | None = None
+    coeff_name: str | None = None
+    short_name: str | None = None
+    coeffs: dict[str, float] | None = None
+    match_confidence: float | None = None
+
+
+def outcome_groups(groups: list[str] | None, *required: str) -> frozenset[str] | None:
+    """
+    Группы исходов olimp.bet, которые сохраняются при разборе (без учета регистра).
+    :param groups: группы из настроек, None или пустой список - все группы
+    :param required: группы, которые нужны всегда (рынки для сравнения по видам спорта)
+    """
+    if not groups:
+        return None
+    return frozenset(group.strip().casefold() for group in (*groups, *required) if group.strip())
+
+
+def make_outcome(outcome: dict, groups: frozenset[str] | None = None) -> Outcome | None:
+    """
+    Исход из ответа API olimp.bet (groupName, shortName, probability, param).
+    None - группа исхода не входит в groups.
+    """
+    group_name = (outcome.get("groupName") or '').strip()
+    if groups is not None and group_name.casefold() not in groups:
+        return None
+    short_name = (outcome.get("shortName") or '').strip()
+    try:
+        coeff = float(outcome.get("probability"))
+    except (TypeError, ValueError):
+        coeff = None
+    return Outcome(group_name, short_name, outcome_key(short_name, outcome.get("param")), coeff)
+
+
+def make_outcomes(outcomes: list[dict] | None, groups: frozenset[str] | None = None) -> list[Outcome]:
+    result = []
+    for outcome in outcomes or []:
+        record = make_outcome(outcome, groups)
+        if record is not None:
+            result.append(record)
+    return result
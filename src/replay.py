@@ -0,0 +1,213 @@
+"""
+Запись ответов сайтов на диск и их воспроизведение локальным сервером-заглушкой,
+чтобы измерять работу всей цепочки без обращения к настоящим сайтам.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+from yarl import URL
+
+from src.cache import body_hash
+from src.metrics import METRICS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+my_log = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.json'
+
+
+def log(s, is_error: bool = False):
+    msg = f'[REPLAY] -> {s}'
+    if not is_error:
+        my_log.info(msg)
+    else:
+        my_log.error(msg)
+
+
+def _path_qs(url: str) -> str:
+    """
+    Путь с параметрами в том виде, в котором его отправляет aiohttp (yarl): vids%5B%5D=1%3A -> vids%5B%5D=1:,
+    live[]=1 -> live%5B%5D=1. Ключ записи и ключ запроса к серверу строятся одинаково.
+    """
+    return URL(url).raw_path_qs
+
+
+class Recorder:
+    """
+    Сохраняет тела ответов в папку: один файл на адрес + index.json (путь с параметрами -> файл и тип содержимого).
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        index_path = self.path / INDEX_FILE
+        self.index = json.loads(index_path.read_text(encoding='utf-8')) if index_path.exists() else dict()
+
+    def record(self, url: str, body: str | bytes):
+        if body is None:
+            return
+        path_qs = _path_qs(url)
+        body = body.encode('utf-8') if isinstance(body, str) else body
+        file_name = f'{hashlib.sha1(path_qs.encode("utf-8")).hexdigest()}.body'
+        (self.path / file_name).write_bytes(body)
+        is_json = body.lstrip()[:1] in (b'[', b'{')
+        self.index[path_qs] = {
+            "file": file_name,
+            "content_type": 'application/json' if is_json else 'text/html',
+            "url": url,
+        }
+
+    def save(self):
+        (self.path / INDEX_FILE).write_text(json.dumps(self.index, ensure_ascii=False, indent=2), encoding='utf-8')
+        log(f'Сохранено ответов: {len(self.index)} в {self.path}')
+
+
+class ReplayServer:
+    """
+    Локальный сервер, отдающий записанные Recorder ответы по тому же пути с параметрами.
+    Задержка, разброс задержки и доля ошибок (503) задаются для имитации настоящих сайтов.
+    """
+
+    def __init__(self,
+                 path: str | Path,
+                 host: str = '127.0.0.1',
+                 port: int = 8080,
+                 latency: float = 0.0,
+                 jitter: float = 0.0,
+                 error_rate: float = 0.0):
+        """
+        :param latency: задержка ответа, сек
+        :param jitter: случайное отклонение задержки, +/- сек
+        :param error_rate: доля запросов (0..1), на которые вернется 503
+        """
+        self.path = Path(path)
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        # записи, сделанные до нормализации ключей, тоже находятся
+        self.index = {_path_qs(path_qs): item
+                      for path_qs, item in json.loads((self.path / INDEX_FILE).read_text(encoding='utf-8')).items()}
+        self.requests = 0
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    def local_url(self, url: str) -> str:
+        """
+        Адрес настоящего сайта -> тот же путь на локальном сервере.
+        """
+        return f'{self.base_url}{_path_qs(url)}'
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        delay = max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            return web.Response(status=503, text='Service Unavailable')
+
+        # raw_path - путь запроса без декодирования (браузер может не кодировать [] в параметрах)
+        item = self.index.get(_path_qs(request.raw_path))
+        if item is None:
+            return web.Response(status=404, text='Not recorded')
+        body = (self.path / item.get("file")).read_bytes()
+        # как и настоящий сервер с ETag: неизменившийся ответ на условный запрос - 304 без тела
+        etag = f'"{body_hash(body)}"'
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(body=body, content_type=item.get("content_type"), charset='utf-8', headers={'ETag': etag})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route('GET', '/{tail:.*}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        if not self.port:
+            # порт 0 - любой свободный, выбранный системой
+            self.port = self._runner.addresses[0][1]
+        log(f'Сервер воспроизведения запущен на {self.base_url}, записано ответов: {len(self.index)}')
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def peak_rss_mb() -> float | None:
+    """
+    Пиковый объем памяти процесса и дочерних процессов (пул разбора), МБ. None - нет данных (Windows).
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux - КБ, macOS - байты
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def benchmark_report(wall_time: float, server: ReplayServer | None = None) -> str:
+    requests = server.requests if server is not None else int(METRICS.total("olimp_http_requests_total"))
+    parse_times = {dict(labels).get("stage"): seconds
+                   for labels, seconds in METRICS.histogram_sums("olimp_parse_seconds").items()}
+    rss = peak_rss_mb()
+    lines = [
+        'Результаты замера:',
+        f'- общее время: {round(wall_time, 3)} сек',
+        f'- запросов: {requests}, запросов/сек: {round(requests / wall_time, 1) if wall_time else 0}',
+        f'- скачано: {round(METRICS.total("olimp_http_bytes_total") / 1024, 1)} КБ',
+        f'- время разбора: {round(sum(parse_times.values()), 3)} сек '
+        f'({", ".join(f"{stage} {round(seconds, 3)}" for stage, seconds in sorted(parse_times.items()))})',
+        f'- пиковая память: {rss if rss is not None else "н/д"} МБ',
+    ]
+    return '\n'.join(lines)
+
+
+async def check_round_trip(*urls: str) -> bool:
+    """
+    Запись ответов для адресов настоящих сайтов и их получение через сервер воспроизведения тем же клиентом,
+    что и в работе (aiohttp): каждый записанный ответ должен вернуться без изменений.
+    """
+    urls = urls or ('https://www.olimp.bet/api/v4/0/live/sports-with-competitions-with-events?vids%5B%5D=1%3A',
+                    'https://www.olimp.com/betting/index.php?page=line&action=2&live[]=123')
+    is_ok = True
+    with tempfile.TemporaryDirectory() as path:
+        recorder = Recorder(path)
+        for i, url in enumerate(urls):
+            recorder.record(url, f'<html>{i}</html>')
+        recorder.save()
+        server = ReplayServer(path, port=0)
+        await server.start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                for i, url in enumerate(urls):
+                    async with session.get(server.local_url(url)) as response:
+                        body = await response.text()
+                    if response.status != 200 or body != f'<html>{i}</html>':
+                        is_ok = False
+                        log(f'Ответ не воспроизведен: {url} -> {response.status}', is_error=True)
+        finally:
+            await server.stop()
+    print('Все ответы воспроизведены' if is_ok else 'Есть невоспроизведенные ответы')
+    return is_ok
+
+
+if __name__ == '__main__':
+    # проверка: python -m src.replay [адрес ...]
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(0 if asyncio.run(check_round_trip(*sys.argv[1:])) else 1)
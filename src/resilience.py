@@ -0,0 +1,151 @@
+"""
+Устойчивость запросов к сайтам:
+- повтор с экспоненциальной задержкой со случайным разбросом (full jitter), чтобы повторы не шли пачкой;
+- автомат отключения (circuit breaker) по каждому хосту: после нескольких ошибок подряд запросы к сайту
+  сразу возвращают ошибку, через заданное время пропускается один пробный запрос;
+- дублирующий запрос (hedging): если ответ не пришел за p95 времени ответа хоста, отправляется второй такой же,
+  используется первый полученный ответ.
+"""
+import logging
+import random
+import time
+from collections import deque
+
+from src.metrics import METRICS
+
+my_log = logging.getLogger(__name__)
+
+
+def log(s, is_error: bool = False):
+    msg = f'[RESILIENCE] -> {s}'
+    if not is_error:
+        my_log.info(msg)
+    else:
+        my_log.error(msg)
+
+
+def backoff_delay(try_num: int, base: float = 0.5, cap: float = 10.0) -> float:
+    """
+    Задержка перед попыткой try_num (со второй): случайное значение от 0 до base * 2^(try_num - 2), не больше cap.
+    """
+    return random.uniform(0, min(cap, base * 2 ** max(0, try_num - 2)))
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, host: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        """
+        :param failure_threshold: после скольких ошибок подряд отключать запросы к хосту
+        :param reset_timeout: через сколько секунд пропустить пробный запрос
+        """
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        METRICS.inc("olimp_circuit_rejected_total", host=self.host)
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            log(f'{self.host}: сайт снова отвечает, запросы включены')
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trial_in_flight = False
+        METRICS.set("olimp_circuit_open", 0, host=self.host)
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                log(f'{self.host}: {self.failures} ошибок подряд, запросы отключены на {self.reset_timeout} сек',
+                    is_error=True)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            METRICS.set("olimp_circuit_open", 1, host=self.host)
+
+
+class LatencyTracker:
+    """
+    Время последних успешных ответов хоста для расчета p95.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.latencies = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def observe(self, latency: float):
+        self.latencies.append(latency)
+
+    def p95(self) -> float | None:
+        """
+        None - замеров пока мало.
+        """
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+class ResiliencePolicy:
+    """
+    Общие на весь запуск настройки и состояние по хостам: автоматы отключения и время ответов.
+    """
+
+    def __init__(self,
+                 max_tries: int = 3,
+                 backoff_base: float = 0.5,
+                 backoff_cap: float = 10.0,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30,
+                 hedge: bool = False):
+        """
+        :param max_tries: минимальное количество попыток для каждого запроса
+        :param backoff_base, backoff_cap: начальная и максимальная задержка перед повтором, сек
+        :param failure_threshold, reset_timeout: настройки автомата отключения (CircuitBreaker)
+        :param hedge: отправлять дублирующий запрос, если ответ не пришел за p95 времени ответа хоста
+        """
+        self.max_tries = max_tries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedge = hedge
+        self._breakers: dict[str, CircuitBreaker] = dict()
+        self._latencies: dict[str, LatencyTracker] = dict()
+
+    def backoff(self, try_num: int) -> float:
+        return backoff_delay(try_num, self.backoff_base, self.backoff_cap)
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(host, self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    def latency(self, host: str) -> LatencyTracker:
+        tracker = self._latencies.get(host)
+        if tracker is None:
+            tracker = self._latencies[host] = LatencyTracker()
+        return tracker
+
+    def hedge_after(self, host: str) -> float | None:
+        """
+        Через сколько секунд отправлять дублирующий запрос к хосту, None - не отправлять.
+        """
+        return self.latency(host).p95() if self.hedge else None
@@ -0,0 +1,156 @@
+"""
+Планировщик запросов по сайтам: не больше заданного количества одновременных запросов к одному хосту
+(по ТЗ - один), ограничение частоты запросов (token bucket), очередь по приоритету и отмена запросов,
+которые не дождались своей очереди до срока.
+Ожидание в очереди, глубина очереди и просроченные запросы видны в метриках.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+from src.metrics import METRICS
+
+# меньше - раньше: список игр нужен до страниц матчей
+PRIORITY_LIST = 0.0
+PRIORITY_DEFAULT = 1.0
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """
+    Запрос не дождался очереди к сайту до заданного срока.
+    """
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        :param rate: запросов в секунду (0 - без ограничения)
+        :param burst: сколько запросов можно сделать подряд после простоя
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def delay(self) -> float:
+        """
+        Через сколько секунд будет доступен запрос (0 - уже доступен).
+        """
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate > 0:
+            self.tokens -= 1
+
+
+class _HostQueue:
+    def __init__(self, host: str, limit: int, rate: float, burst: int):
+        self.host = host
+        self.limit = max(1, limit)
+        self.bucket = TokenBucket(rate, burst)
+        self.active = 0
+        # (приоритет, порядковый номер, future ожидающего запроса)
+        self.waiters = []
+        self._counter = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    async def acquire(self, priority: float, deadline: float | None):
+        if self.active < self.limit and not self.waiters and not self.bucket.delay():
+            self._grant()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self._counter), future))
+        METRICS.set("olimp_scheduler_queue_depth", len(self.waiters), host=self.host)
+        self._dispatch()
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        # asyncio.wait не отменяет future сам, поэтому разрешение, выданное в момент истечения срока, не теряется
+        try:
+            await asyncio.wait([future], timeout=timeout)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                future.cancel()
+            raise
+        if not future.done():
+            future.cancel()
+            METRICS.inc("olimp_scheduler_expired_total", host=self.host)
+            raise DeadlineExceeded(f'{self.host}: запрос не дождался очереди')
+
+    def release(self):
+        self.active -= 1
+        METRICS.set("olimp_scheduler_in_flight", self.active, host=self.host)
+        self._dispatch()
+
+    def _grant(self):
+        self.bucket.take()
+        self.active += 1
+        METRICS.set("olimp_scheduler_in_flight", self.active, host=self.host)
+
+    def _dispatch(self):
+        self._timer = None
+        while self.waiters and self.active < self.limit:
+            _, _, future = self.waiters[0]
+            if future.done():
+                # отменен по сроку
+                heapq.heappop(self.waiters)
+                continue
+            delay = self.bucket.delay()
+            if delay:
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                break
+            heapq.heappop(self.waiters)
+            self._grant()
+            future.set_result(None)
+        METRICS.set("olimp_scheduler_queue_depth", len(self.waiters), host=self.host)
+
+
+class RequestScheduler:
+    """
+    Очереди создаются для каждого хоста при первом запросе, настройки у всех хостов общие.
+    """
+
+    def __init__(self, limit_per_host: int = 1, rate_per_host: float = 0, burst: int = 1):
+        """
+        :param limit_per_host: одновременных запросов к одному хосту
+        :param rate_per_host: запросов в секунду к одному хосту (0 - без ограничения)
+        :param burst: сколько запросов подряд разрешено после простоя при ограничении частоты
+        """
+        self.limit_per_host = limit_per_host
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self._hosts: dict[str, _HostQueue] = dict()
+
+    @asynccontextmanager
+    async def slot(self,
+                   url: str,
+                   priority: float = PRIORITY_DEFAULT,
+                   deadline: float | None = None,
+                   proxy: str | None = None):
+        """
+        Место в очереди к хосту url на время запроса.
+        :param priority: меньше - раньше
+        :param deadline: time.monotonic(), до которого запрос должен получить очередь, иначе DeadlineExceeded
+        :param proxy: имя прокси запроса - у каждого прокси (IP) своя очередь к хосту
+        """
+        host = urlsplit(url).hostname or ''
+        if proxy is not None:
+            host = f'{host}@{proxy}'
+        queue = self._hosts.get(host)
+        if queue is None:
+            queue = self._hosts[host] = _HostQueue(host, self.limit_per_host, self.rate_per_host, self.burst)
+        with METRICS.timer("olimp_scheduler_wait_seconds", host=host):
+            await queue.acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            queue.release()
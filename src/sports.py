@@ -0,0 +1,28 @@
+"""
+Виды спорта и рынки для сравнения по каждому виду спорта.
+"""
+# код вида спорта в коде страницы olimp.com (data-sport) и в API olimp.bet (vids[]) один и тот же
+DATA_SPORT = {
+    "Футбол": "1",
+    "Хоккей": "2",
+    "Теннис": "3",
+    "Баскетбол": "5",
+    "Настольный теннис": "40",
+    "Киберспорт": "112",
+    "Волейбол": "10",
+    # и т.д.
+}
+
+# рынок по умолчанию: (название группы исходов olimp.bet, короткое название исхода olimp.com)
+DEFAULT_MARKET = ('Исход матча (основное время)', 'П1')
+
+
+def game_key(all_games: dict, name: str, sport: str) -> str:
+    """
+    Ключ игры в словаре игр сайта: название, а если такое название уже есть у игры другого вида спорта
+    (Спартак - ЦСКА в футболе и хоккее) - название с видом спорта.
+    """
+    game = all_games.get(name)
+    if game is None or game.sport == sport:
+        return name
+    return f'{name} [{sport}]'
@@ -0,0 +1,230 @@
+"""
+История коэффициентов: снимки всех исходов по каждой игре и расхождения коэффициентов между сайтами
+в SQLite (режим WAL). Запись идет отдельным потоком: за цикл сравнения - одна пачка в одной транзакции,
+получение данных с сайтов запись не ждет.
+
+Снимки хранятся по сайту, comp_id, рынку (группе исходов olimp.bet) и времени. Снимок сайта пишется только
+в том цикле, в котором данные этого сайта обновились.
+
+Запросы из командной строки (из корня проекта):
+    python -m src.storage movement <comp_id> [секунд, по умолчанию 3600]  # движение коэффициентов матча
+    python -m src.storage divergences <процент>                             # расхождения больше процента за сегодня
+"""
+import logging
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+my_log = logging.getLogger(__name__)
+
+SITES = ('olimp.com', 'olimp.bet')
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS snapshots (
+        ts REAL NOT NULL,
+        site TEXT NOT NULL,
+        comp_id TEXT NOT NULL,
+        game TEXT NOT NULL,
+        market TEXT NOT NULL DEFAULT '',
+        outcome TEXT NOT NULL,
+        coeff REAL NOT NULL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS divergences (
+        ts REAL NOT NULL,
+        game TEXT NOT NULL,
+        comp_id TEXT NOT NULL,
+        comp_id_compare TEXT NOT NULL,
+        market TEXT NOT NULL DEFAULT '',
+        outcome TEXT NOT NULL,
+        coeff REAL NOT NULL,
+        coeff_compare REAL NOT NULL,
+        diff_pct REAL NOT NULL
+    )''',
+)
+# базы, созданные до появления рынка: столбец добавляется, индекс без сайта и рынка заменяется
+MIGRATIONS = (
+    ('snapshots', 'market', "ALTER TABLE snapshots ADD COLUMN market TEXT NOT NULL DEFAULT ''"),
+    ('divergences', 'market', "ALTER TABLE divergences ADD COLUMN market TEXT NOT NULL DEFAULT ''"),
+)
+INDEXES = (
+    'DROP INDEX IF EXISTS snapshots_game_ts',
+    # движение коэффициентов матча на сайте (по рынку) за период
+    'CREATE INDEX IF NOT EXISTS snapshots_site_game ON snapshots (site, comp_id, market, ts)',
+    # расхождения за период: диапазон по времени, процент проверяется по записям индекса
+    'CREATE INDEX IF NOT EXISTS divergences_ts ON divergences (ts, diff_pct)',
+)
+
+
+def log(s, is_error: bool = False):
+    msg = f'[STORAGE] -> {s}'
+    if not is_error:
+        my_log.info(msg)
+    else:
+        my_log.error(msg)
+
+
+def _connect(path: str | Path) -> sqlite3.Connection:
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode=WAL')
+    # в режиме WAL NORMAL не теряет целостность базы, а fsync только на контрольных точках
+    connection.execute('PRAGMA synchronous=NORMAL')
+    for statement in SCHEMA:
+        connection.execute(statement)
+    for table, column, statement in MIGRATIONS:
+        if column not in {row[1] for row in connection.execute(f'PRAGMA table_info({table})')}:
+            connection.execute(statement)
+    for statement in INDEXES:
+        connection.execute(statement)
+    connection.commit()
+    return connection
+
+
+def outcome_markets(games: dict) -> dict[str, dict[str, str]]:
+    """
+    Рынок каждого исхода по играм olimp.bet: ключ игры -> исход -> группа исходов.
+    На olimp.com групп нет, исходы той же игры относятся к тем же рынкам.
+    """
+    markets = dict()
+    for name, game in games.items():
+        game_markets = markets[name] = dict()
+        for outcome in game.outcomes:
+            game_markets.setdefault(outcome.key, outcome.group_name)
+    return markets
+
+
+def snapshot_rows(ts: float, games: dict, markets: dict[str, dict[str, str]]) -> list[tuple]:
+    """
+    Строки таблицы snapshots по играм одного сайта с заполненным coeffs.
+    :param markets: результат outcome_markets
+    """
+    rows = []
+    for name, game in games.items():
+        game_markets = markets.get(name, {})
+        for outcome, coeff in (game.coeffs or {}).items():
+            if coeff:
+                rows.append((ts, game.site, str(game.comp_id), name, game_markets.get(outcome, ''), outcome, coeff))
+    return rows
+
+
+def divergence_rows(ts: float, games: dict, games_compare: dict, markets: dict[str, dict[str, str]]) -> list[tuple]:
+    """
+    Строки таблицы divergences: исходы совпадающих игр, которые есть на обоих сайтах.
+    diff_pct - на сколько процентов коэффициент первого сайта больше коэффициента второго.
+    """
+    rows = []
+    for name, game in games.items():
+        game_compare = games_compare.get(name)
+        if game_compare is None:
+            continue
+        coeffs_compare = game_compare.coeffs or {}
+        game_markets = markets.get(name, {})
+        for outcome, coeff in (game.coeffs or {}).items():
+            coeff_compare = coeffs_compare.get(outcome)
+            if coeff and coeff_compare:
+                rows.append((ts, name, str(game.comp_id), str(game_compare.comp_id), game_markets.get(outcome, ''),
+                             outcome, coeff, coeff_compare, round((coeff / coeff_compare - 1) * 100, 3)))
+    return rows
+
+
+class SnapshotStore:
+    """
+    Пишущий поток владеет своим соединением и забирает циклы сравнения из очереди,
+    поэтому add_compare только ставит данные в очередь и сразу возвращается.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._writer, name='snapshot-writer', daemon=True)
+        self._thread.start()
+
+    def add_compare(self, olimps: list[dict, dict], sites: tuple[str, ...] = SITES):
+        """
+        :param olimps: совпадающие игры [olimp.bet, olimp.com] с коэффициентами, как для show_same_games_with_coeffs
+        :param sites: сайты, данные которых обновились с прошлого сравнения: снимки пишутся только для них,
+            расхождения - всегда
+        """
+        self._queue.put((time.time(), olimps, sites))
+
+    def close(self):
+        """
+        Дописывает все поставленные в очередь циклы и закрывает базу.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _writer(self):
+        connection = _connect(self.path)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                try:
+                    self._write(connection, *item)
+                except sqlite3.Error as e:
+                    log(f'Ошибка записи в {self.path}: {e}', is_error=True)
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _write(connection: sqlite3.Connection, ts: float, olimps: list[dict, dict], sites: tuple[str, ...]):
+        olimp_bet, olimp_com = olimps
+        markets = outcome_markets(olimp_bet)
+        snapshots = []
+        for site, games in (('olimp.com', olimp_com), ('olimp.bet', olimp_bet)):
+            if site in sites:
+                snapshots += snapshot_rows(ts, games, markets)
+        divergences = divergence_rows(ts, olimp_com, olimp_bet, markets)
+        with connection:
+            connection.executemany('INSERT INTO snapshots (ts, site, comp_id, game, market, outcome, coeff) '
+                                   'VALUES (?, ?, ?, ?, ?, ?, ?)', snapshots)
+            connection.executemany('INSERT INTO divergences (ts, game, comp_id, comp_id_compare, market, outcome, '
+                                   'coeff, coeff_compare, diff_pct) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', divergences)
+
+
+def get_movement(path: str | Path,
+                 comp_id: str,
+                 period: float = 3600,
+                 sites: tuple[str, ...] = SITES) -> list[tuple]:
+    """
+    Коэффициенты матча comp_id на заданных сайтах за последние period секунд: (ts, site, market, outcome, coeff).
+    """
+    with closing(_connect(path)) as connection:
+        return connection.execute(
+            f'SELECT ts, site, market, outcome, coeff FROM snapshots '
+            f'WHERE site IN ({", ".join("?" * len(sites))}) AND comp_id = ? AND ts >= ? ORDER BY site, outcome, ts',
+            (*sites, str(comp_id), time.time() - period)).fetchall()
+
+
+def get_divergences(path: str | Path, min_pct: float, since: float | None = None) -> list[tuple]:
+    """
+    Расхождения коэффициентов больше min_pct процентов (в любую сторону) начиная с since (по умолчанию - с начала суток):
+    (ts, game, outcome, coeff, coeff_compare, diff_pct).
+    """
+    if since is None:
+        since = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    with closing(_connect(path)) as connection:
+        return connection.execute(
+            'SELECT ts, game, outcome, coeff, coeff_compare, diff_pct FROM divergences '
+            'WHERE ts >= ? AND (diff_pct > ? OR diff_pct < ?) ORDER BY ts',
+            (since, min_pct, -min_pct)).fetchall()
+
+
+if __name__ == '__main__':
+    DEFAULT_PATH = 'Data/snapshots.db'
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'movement' and len(sys.argv) > 2:
+        period = float(sys.argv[3]) if len(sys.argv) > 3 else 3600
+        for ts, site, market, outcome, coeff in get_movement(DEFAULT_PATH, sys.argv[2], period):
+            print(f'{datetime.fromtimestamp(ts):%H:%M:%S} {site:<10} {market:<32} {outcome:<16} {coeff}')
+    elif command == 'divergences' and len(sys.argv) > 2:
+        for ts, game, outcome, coeff, coeff_compare, diff_pct in get_divergences(DEFAULT_PATH, float(sys.argv[2])):
+            print(f'{datetime.fromtimestamp(ts):%H:%M:%S} {game} - {outcome}: {coeff} / {coeff_compare} ({diff_pct:+}%)')
+    else:
+        print(__doc__)
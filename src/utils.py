@@ -1,55 +1,266 @@
 import asyncio
 import logging
+import time
+from contextlib import nullcontext
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
 
 import aiohttp
-from playwright.async_api import async_playwright, Page
+from multidict import CIMultiDictProxy
+
+from src.http_client import HttpClient
+from src.metrics import METRICS
+from src.proxy_pool import BAN_STATUSES, proxy_url
+from src.scheduler import PRIORITY_DEFAULT, DeadlineExceeded
+
+# playwright загружается только при запуске браузера (src.browser)
+if TYPE_CHECKING:
+    from playwright.async_api import Page
 
 my_log = logging.getLogger(__name__)
 
 
+async def _get_text(session: aiohttp.ClientSession,
+                    url: str,
+                    headers: dict,
+                    cookies: dict | None,
+                    proxy: str | None,
+                    timeout: int,
+                    as_bytes: bool = False) -> tuple[int, CIMultiDictProxy, str | bytes]:
+    async with session.get(url,
+                           headers=headers,
+                           cookies=cookies,
+                           proxy=proxy,
+                           timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+        if as_bytes:
+            return resp.status, resp.headers, await resp.read()
+        return resp.status, resp.headers, await resp.text()
+
+
+class BadResponse(Exception):
+    """
+    Ответ получен, но использовать его нельзя: ошибка сервера (5xx) или бан прокси.
+    """
+
+    def __init__(self, status: int, is_proxy_ban: bool = False):
+        super().__init__(f'ответ {status}')
+        self.status = status
+        self.is_proxy_ban = is_proxy_ban
+
+
+async def _fetch_once(url: str,
+                      host: str,
+                      headers: dict,
+                      cookies: dict | None,
+                      proxy: str | None,
+                      timeout: int,
+                      client: HttpClient | None,
+                      as_bytes: bool,
+                      priority: float,
+                      deadline: float | None,
+                      sticky_proxy: bool,
+                      with_status: bool = False,
+                      started: asyncio.Event | None = None) -> str | bytes | tuple[int, str | bytes]:
+    """
+    Одна попытка запроса: прокси из пула, очередь планировщика, условный GET. Ошибки - исключениями.
+    :param with_status: вернуть код ответа вместе с телом
+    :param started: устанавливается, когда запрос дождался очереди планировщика и отправлен
+    """
+    # явно заданный прокси используется всегда, иначе прокси на каждую попытку выбирается из пула клиента
+    pool = client.proxy_pool if client is not None and not proxy else None
+    proxy_state = pool.acquire(host, sticky_proxy) if pool else None
+    proxies = proxy_state.url if proxy_state is not None else proxy_url(proxy) if proxy else None
+    slot = nullcontext()
+    if client is not None and client.scheduler is not None:
+        slot = client.scheduler.slot(url, priority, deadline, proxy=proxy_state.name if proxy_state is not None else None)
+
+    not_modified = False
+    start_time = time.perf_counter()
+    try:
+        async with slot:
+            start_time = time.perf_counter()
+            if started is not None:
+                started.set()
+            with METRICS.timer("olimp_http_request_seconds", host=host):
+                if client is not None:
+                    conditional_headers, cached_body = client.conditional_headers(url)
+                    status, response_headers, response = await _get_text(client.session, url,
+                                                                          headers | conditional_headers,
+                                                                          cookies, proxies, timeout, as_bytes)
+                    not_modified = status == 304 and cached_body is not None
+                    if not_modified:
+                        METRICS.inc("olimp_http_not_modified_total", host=host)
+                        response = cached_body
+                    elif 200 <= status < 300:
+                        # страницы проверки и ошибок (403, 429 и т.п.) не запоминаются, иначе 304 вернет их снова
+                        client.remember(url, response_headers, response)
+                else:
+                    async with aiohttp.ClientSession() as session:
+                        status, _, response = await _get_text(session, url, headers, cookies, proxies, timeout,
+                                                               as_bytes)
+    except (DeadlineExceeded, asyncio.CancelledError):
+        # прокси не виноват, что запрос не дождался очереди или отменен дублирующим запросом
+        if proxy_state is not None:
+            proxy_state.in_flight -= 1
+        raise
+    except Exception:
+        if proxy_state is not None:
+            pool.release(proxy_state, time.perf_counter() - start_time, is_ok=False)
+        raise
+
+    METRICS.inc("olimp_http_requests_total", host=host)
+    if not not_modified:
+        METRICS.inc("olimp_http_bytes_total", len(response), host=host)
+    if proxy_state is not None:
+        pool.release(proxy_state, time.perf_counter() - start_time, is_ok=True, status=status)
+        if status in BAN_STATUSES:
+            raise BadResponse(status, is_proxy_ban=True)
+    if status >= 500:
+        raise BadResponse(status)
+    if client is not None:
+        if client.resilience is not None:
+            # время ответа без ожидания в очереди планировщика, иначе запросы из хвоста очереди
+            # выглядят медленными и дублируются в ту же очередь
+            client.resilience.latency(host).observe(time.perf_counter() - start_time)
+        client.record(url, response)
+    return (status, response) if with_status else response
+
+
+async def _fetch_hedged(hedge_after: float, host: str, **kwargs) -> str | bytes:
+    """
+    Если первая попытка не ответила за hedge_after секунд - параллельно вторая такая же, результат - первый успешный.
+    Время считается с момента отправки первой попытки, ожидание в очереди планировщика не учитывается.
+    """
+    started = asyncio.Event()
+    first = asyncio.ensure_future(_fetch_once(host=host, started=started, **kwargs))
+    waiter = asyncio.ensure_future(started.wait())
+    try:
+        await asyncio.wait([first, waiter], return_when=asyncio.FIRST_COMPLETED)
+        if not first.done():
+            await asyncio.wait([first], timeout=hedge_after)
+    except BaseException:
+        first.cancel()
+        raise
+    finally:
+        waiter.cancel()
+    if first.done():
+        return first.result()
+
+    METRICS.inc("olimp_http_hedged_total", host=host)
+    pending = {first, asyncio.ensure_future(_fetch_once(host=host, **kwargs))}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        METRICS.inc("olimp_http_hedge_wins_total", host=host)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
 async def fetch_response(url: str,
                          headers: dict,
                          cookies: dict | None = None,
                          max_tries=1,
                          pause_next=1,
                          proxy: str | None = None,
-                         timeout: int = 30) -> str | None:
-    proxies = None
-    if proxy:
-        ip = proxy.split(':')[0]
-        port = proxy.split(':')[1]
-        login = proxy.split(':')[2]
-        password = proxy.split(':')[3]
-        proxies = f"https://{login}:{password}@{ip}:{port}"
+                         timeout: int = 30,
+                         client: HttpClient | None = None,
+                         as_bytes: bool = False,
+                         priority: float = PRIORITY_DEFAULT,
+                         deadline: float | None = None,
+                         sticky_proxy: bool = False,
+                         with_status: bool = False) -> str | bytes | tuple[int, str | bytes] | None:
+    """
+    Получение текста ответа по GET-запросу.
+    Если у клиента задана политика устойчивости (client.resilience) - попыток не меньше заданных в ней,
+    задержка между попытками экспоненциальная со случайным разбросом, при отключенном сайте сразу None,
+    медленный запрос дублируется. Иначе - max_tries попыток через pause_next секунд.
+    :param client: общий клиент с пулом соединений. Если не задан - для запроса создается отдельная сессия
+    :param as_bytes: вернуть ответ без декодирования (например, для разбора JSON)
+    :param priority: место в очереди планировщика клиента к сайту (меньше - раньше)
+    :param deadline: time.monotonic(), до которого запрос должен дождаться очереди, иначе возвращается None
+    :param sticky_proxy: использовать для сайта один и тот же прокси из пула клиента, пока он не забанен
+    :param with_status: вернуть код ответа вместе с телом - (код, тело), например, чтобы отличить ошибку сессии (4xx)
+    """
+    host = urlsplit(url).hostname or ''
+    policy = client.resilience if client is not None else None
+    if policy is not None:
+        max_tries = max(max_tries, policy.max_tries)
+    kwargs = dict(url=url, headers=headers, cookies=cookies, proxy=proxy, timeout=timeout, client=client,
+                  as_bytes=as_bytes, priority=priority, deadline=deadline, sticky_proxy=sticky_proxy,
+                  with_status=with_status)
 
     for try_num in range(1, max_tries + 1):
         if try_num > 1:
-            await asyncio.sleep(pause_next)
+            METRICS.inc("olimp_http_retries_total", host=host)
+            await asyncio.sleep(policy.backoff(try_num) if policy is not None else pause_next)
+
+        breaker = policy.breaker(host) if policy is not None else None
+        if breaker is not None and not breaker.allow():
+            my_log.info(f'Запрос "{url}" не отправлен: сайт временно отключен после ошибок')
+            return None
 
+        hedge_after = policy.hedge_after(host) if policy is not None else None
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url,
-                                       headers=headers,
-                                       cookies=cookies,
-                                       proxy=proxies,
-                                       timeout=timeout) as resp:
-                    response = await resp.text()
-                    return response
+            if hedge_after is None:
+                response = await _fetch_once(host=host, **kwargs)
+            else:
+                response = await _fetch_hedged(hedge_after, host, **kwargs)
+        except (DeadlineExceeded, asyncio.CancelledError) as e:
+            if breaker is not None:
+                breaker.trial_in_flight = False
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            # следующая попытка тоже не успеет
+            my_log.info(f'Запрос "{url}" отменен: {e}')
+            return None
         except Exception as e:
+            # бан прокси - не ошибка сайта
+            if breaker is not None:
+                if isinstance(e, BadResponse) and e.is_proxy_ban:
+                    breaker.trial_in_flight = False
+                else:
+                    breaker.record_failure()
+            METRICS.inc("olimp_http_errors_total", host=host)
             my_log.error(f'Ошибка получения ответа при запросе "{url}": {e}')
+            continue
+
+        if breaker is not None:
+            breaker.record_success()
+        return response
 
     my_log.info('Не удалось получить ответ!')
     return None
 
 
-async def get_playwright_no_context(page: Page, url: str):
-    await page.goto(url)
-    response = await page.content()
+async def get_playwright_no_context(page: 'Page', url: str):
+    with METRICS.timer("olimp_browser_seconds"):
+        await page.goto(url)
+        response = await page.content()
     response = response.split('<body><pre>')[-1].split('</pre>')[0]
     return response
 
 
+async def harvest_session(page: 'Page', url: str) -> tuple[dict, str]:
+    """
+    Cookies и User-Agent браузера после открытия страницы, чтобы дальше делать запросы к сайту без браузера.
+    :param url: адрес, для которого нужны cookies
+    """
+    cookies = {cookie.get("name"): cookie.get("value") for cookie in await page.context.cookies(url)}
+    user_agent = await page.evaluate('navigator.userAgent')
+    return cookies, user_agent
+
+
 async def just_check_playwright():
+    from playwright.async_api import async_playwright
+
     test_url = 'https://www.olimp.bet/api/v4/0/live/sports-with-competitions-with-events?vids%5B%5D=1%3A'
     apw = await async_playwright().start()
     browser = await apw.chromium.launch()